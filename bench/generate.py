@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Generates a synthetic manual, shaped like `pdftohtml -i -noframes` output of the MotoPlus API documentation.
+
+Pages are laid out like the real ones: an `<a name=N>` anchor, three header lines, the declarations and two footer
+lines, then an `<hr/>`. Declarations follow `Syntax:` text runs or bold `Syntax` headers and end at U+F06E bullets or
+`Label:` lines. Comments span text runs, and some declarations continue across a page break. Manuals for other
+controllers than the YRC1000 declare one struct differently, as merged headers must handle."""
+
+import argparse
+import html
+import random
+import sys
+
+# roughly the page count of 178941-1CD
+MANUAL_PAGES = 600
+ARGUMENT_TYPES = ['int', 'LONG', 'CHAR *', 'ULONG *', 'const char *', 'ULONG', 'MP_COORD']
+FIELD_TYPES = ['LONG', 'USHORT', 'CHAR', 'ULONG', 'SHORT']
+BULLET = '\uf06e'
+# a name each kind of declaration has, which the header must declare
+DECLARATION_NAMES = ['mpFunc', 'MP_TYPE_', 'mpOther', 'mpX']
+
+
+class Writer:
+    def __init__(self):
+        self.out = []
+
+    def line(self, text: str, bold=False, spaces=False):
+        """Writes a text run, with its spaces as `&#160;` like most runs pdftohtml writes unless `spaces`"""
+        text = html.escape(text, quote=False)
+        if not spaces:
+            text = text.replace(' ', '&#160;')
+        self.out.append(('<b>%s</b>' % text if bold else text) + '<br/>\n')
+
+    def anchor(self, page: int):
+        self.out.append('<a name=%d></a>' % page)
+
+    def page_break(self):
+        self.out.append('<hr/>\n')
+
+
+def page_header(writer: Writer, page: int, robot: str):
+    writer.anchor(page)
+    writer.line('178941-1CD')
+    writer.line('%s MotoPlus' % robot)
+    writer.line('%d API Function Specifications' % page)
+
+
+def page_footer(writer: Writer, page: int):
+    writer.line('%d-%d' % (page // 10 + 1, page))
+    writer.line('HW1483602')
+
+
+def syntax_function(writer: Writer, rng: random.Random, number: int, page: int, robot: str) -> int:
+    """A `Syntax:` text run, with comments spanning text runs. Returns the page it ends on."""
+    writer.line('%d.%d mpFunc%d' % (page, number % 10, number), bold=True)
+    writer.line('Syntax: %s mpFunc%d(' % (rng.choice(['int', 'LONG', 'STATUS']), number))
+    for argument in range(rng.randint(1, 5)):
+        writer.line('%s arg%d,' % (rng.choice(ARGUMENT_TYPES), argument))
+        if rng.random() < 0.3:
+            writer.line('/* comment about arg%d, (see' % argument)
+            writer.line('notes) */')
+        if rng.random() < 0.08:
+            page_footer(writer, page)
+            writer.page_break()
+            page += 1
+            page_header(writer, page, robot)
+    writer.line('%s last );' % rng.choice(ARGUMENT_TYPES))
+    writer.line('%s Return Value' % BULLET)
+    writer.line('Explanation: returns 0 on success')
+    return page
+
+
+def syntax_struct(writer: Writer, rng: random.Random, number: int):
+    """A bold `Syntax` header over a struct, with inline field comments and defines"""
+    writer.line('Syntax', bold=True)
+    writer.line('typedef struct')
+    writer.line('{')
+    for field in range(rng.randint(1, 6)):
+        writer.line('%s field%d; /* field %d (unit: mm) */' % (rng.choice(FIELD_TYPES), field, field))
+        if rng.random() < 0.2:
+            writer.line('#define MAXV%d (%d)' % (number, field))
+    writer.line('} MP_TYPE_%d;' % (number % 97))
+    writer.line('%s Members' % BULLET)
+
+
+def syntax_header_function(writer: Writer, number: int):
+    """A bold `Syntax` header over a function with a comment across two text runs"""
+    writer.line('Syntax', bold=True)
+    writer.line('int mpOther%d(int a, /* the' % number)
+    writer.line('arg [see note] */ int b);')
+    writer.line('Return:')
+
+
+def generate(scale: float, seed: int = 0, robot: str = 'YRC1000') -> str:
+    rng = random.Random(seed)
+    writer = Writer()
+    writer.out.append('<!DOCTYPE html><html>\n<head>\n<title>178941-1CD</title>\n'
+                      '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8"/>\n</head>\n'
+                      '<body bg="#A0A0A0" vlink="blue" link="blue">\n')
+    pages = max(1, round(MANUAL_PAGES * scale))
+    number = 0
+    page = 1
+    while page <= pages:
+        if page == 1:
+            writer.anchor(page)
+            writer.line('%s OPTIONS' % robot)
+            writer.line('178941-1CD')
+            writer.line('%s MotoPlus' % robot)
+            writer.line('Contents')
+            # used by the MP_EXPOS_DATA struct that main.py adds
+            writer.line('Syntax', bold=True)
+            writer.line('typedef struct')
+            writer.line('{')
+            writer.line('CTRLG_T ctrl_grp; /* control group */')
+            writer.line('%s pos[8]; /* position */' % ('LONG' if robot == 'YRC1000' else 'ULONG'))
+            writer.line('} MP_GRP_POS_INFO;')
+            writer.line('%s Members' % BULLET)
+        else:
+            page_header(writer, page, robot)
+        for _ in range(rng.randint(1, 4)):
+            number += 1
+            kind = rng.random()
+            if kind < 0.35:
+                page = syntax_function(writer, rng, number, page, robot)
+            elif kind < 0.7:
+                syntax_struct(writer, rng, number)
+            elif kind < 0.8:
+                syntax_header_function(writer, number)
+            elif kind < 0.9:
+                # the anchor only matches with plain spaces, and the declaration follows it
+                writer.line('Applies to all axes (multiple control groups).', spaces=True)
+                writer.line('LONG mpX%d(CTRLG_T g);' % number)
+                writer.line('Description: see above')
+            else:
+                writer.line('Plain prose with no declaration %d.' % number)
+                writer.line('Note: nothing to extract')
+        page_footer(writer, page)
+        writer.page_break()
+        page += 1
+    writer.out.append('</body>\n</html>\n')
+    return ''.join(writer.out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates a synthetic MotoPlus manual as pdftohtml output')
+    parser.add_argument('-s', '--scale', type=float, default=1,
+                        help='size relative to the real manual, e.g. 0.1 or 50 (default: 1)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--robot', default='YRC1000', help='the controller the manual is for (default: YRC1000)')
+    parser.add_argument('-o', '--output', metavar='FILE', help='write to FILE instead of stdout')
+    args = parser.parse_args()
+
+    manual = generate(args.scale, args.seed, args.robot)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(manual)
+    else:
+        sys.stdout.write(manual)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Checks and times the re-extraction of a new revision of a synthetic manual with a cache.
+
+A manual is generated and run through main.py with an empty cache. Then a declaration is changed on a few pages,
+including pages that a declaration from the page before continues onto, and the new revision is run with the same
+cache. Its header must be identical to that of an uncached run. Every page declaring a changed declaration must be
+parsed again, and the only other pages parsed again may be ones whose declarations reach a changed page: they
+continue onto the next page at most, and the parser reads at most one chunk past them."""
+
+import argparse
+import bisect
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as extractplus  # noqa: E402
+from generate import generate  # noqa: E402
+
+PAGE_BREAK = '<hr/>'
+
+
+def spread(items: List[int], count: int) -> List[int]:
+    return list(dict.fromkeys(items[(k + 1) * len(items) // (count + 1)] for k in range(count))) if items else []
+
+
+def revise(manual: str, edits: int) -> Tuple[str, Set[int]]:
+    """Changes a declaration on up to `edits` pages spread over the manual, half of them continuations of a
+    declaration from the page before. Returns the new revision and the pages that must be parsed again."""
+    pages = manual.split(PAGE_BREAK)
+    # pages[i] is page i + 1, so a declaration continued onto pages[i] is anchored on page i
+    continued = [i + 1 for i, page in enumerate(pages[:-1])
+                 if 'Syntax:' in page and 'last&#160;);' not in page.rsplit('Syntax:', 1)[1]]
+    structs = [i for i, page in enumerate(pages) if 'field0;' in page and i not in continued]
+    required = set()
+    for i in spread(continued, edits // 2):
+        pages[i] = pages[i].replace('last&#160;);', 'final&#160;);', 1)
+        required.add(i)
+    for i in spread(structs, edits - edits // 2):
+        pages[i] = pages[i].replace('field0;', 'renamed0;', 1)
+        required.add(i + 1)
+    return PAGE_BREAK.join(pages), required
+
+
+def page_bounds(path: str) -> List[int]:
+    with open(path, 'rb') as file:
+        data = file.read()
+    starts = extractplus.page_starts(data)
+    return starts + [len(data)]
+
+
+def allowed_pages(old: str, new: str) -> Set[int]:
+    """The pages of `new` with declarations that may be parsed again: the changed ones and those before them whose
+    declarations reach them"""
+    with open(old, 'rb') as file:
+        old_data = file.read()
+    with open(new, 'rb') as file:
+        new_data = file.read()
+    old_bounds = page_bounds(old)
+    bounds = page_bounds(new)
+    changed = [page for page in range(1, len(bounds))
+               if new_data[bounds[page - 1]:bounds[page]] != old_data[old_bounds[page - 1]:old_bounds[page]]]
+    allowed = set()
+    for page in extractplus.anchor_pages(new_data, bounds[:-1]):
+        # declarations end on the next page at the latest, and the parser may have read one chunk past its end
+        end = bounds[min(page + 1, len(bounds) - 1)] + extractplus.REGION_CHUNK_SIZE
+        reach = bisect.bisect_left(bounds, end)
+        if any(page <= other <= reach for other in changed):
+            allowed.add(page)
+    return allowed
+
+
+def run(path: str, cache: extractplus.Cache, stats: extractplus.Stats = extractplus.NO_STATS) -> str:
+    header, _, _ = extractplus.generate_cached(path, 1, cache, stats)
+    return header
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks and times the re-extraction of a changed synthetic manual '
+                                                 'with a cache')
+    parser.add_argument('-s', '--scale', type=float, default=1,
+                        help='size of the manual relative to the real one (default: 1)')
+    parser.add_argument('-e', '--edits', type=int, default=4, help='pages to change (default: 4)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        old = os.path.join(directory, 'old.html')
+        new = os.path.join(directory, 'new.html')
+        manual = generate(args.scale)
+        with open(old, 'w', encoding='utf-8') as file:
+            file.write(manual)
+        revision, required = revise(manual, args.edits)
+        with open(new, 'w', encoding='utf-8') as file:
+            file.write(revision)
+
+        start = time.perf_counter()
+        with extractplus.open_input(new) as file:
+            expected = extractplus.generate(*extractplus.extract(file))[0]
+        uncached = time.perf_counter() - start
+
+        warm = os.path.join(directory, 'warm')
+        run(old, extractplus.Cache(warm, 1 << 40))
+        counted = os.path.join(directory, 'counted')
+        shutil.copytree(warm, counted)
+        start = time.perf_counter()
+        header = run(new, extractplus.Cache(warm, 1 << 40))
+        incremental = time.perf_counter() - start
+        stats = extractplus.Stats(enabled=True)
+        run(new, extractplus.Cache(counted, 1 << 40), stats)
+        allowed = allowed_pages(old, new)
+
+    parsed = stats.counts['stale_pages']
+    print(f'pages with declarations: {stats.counts["pages"]}, changed or reaching a change: {len(allowed)}, '
+          f'parsed again: {parsed}')
+    print(f'uncached: {uncached:.2f}s, with the cache of the previous revision: {incremental:.2f}s')
+    status = 0
+    if header != expected:
+        print('the header differs from an uncached run')
+        status = 1
+    if not required <= allowed or not len(required) <= parsed <= len(allowed):
+        print(f'expected {len(required)} to {len(allowed)} pages to be parsed again')
+        status = 1
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Times each phase of main.py on synthetic manuals of several sizes.
+
+The manuals are written to files and read the way main.py reads an HTML file, so extraction searches the mapped file
+for the pages that may have declarations. Each run happens in a fresh process, so that its peak RSS is not inflated by
+the runs before it. For every phase, the wall time and the start of the SHA-256 of its output are reported; a changed
+hash means the change being measured also changed the output. The peak RSS is reported for each whole run, as it only
+ever grows within a process."""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as extractplus  # noqa: E402
+from generate import generate  # noqa: E402
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def measure(path: str, jobs: int) -> dict:
+    """Runs the phases of main.py on the manual at `path`, returning `(phase, seconds, hash)` for each and the peak RSS
+    of the run"""
+    phases = []
+    start = time.perf_counter()
+
+    def phase(name: str, output: str):
+        nonlocal start
+        end = time.perf_counter()
+        phases.append((name, end - start, digest(output)))
+        start = time.perf_counter()
+
+    with extractplus.open_input(path, jobs) as file:
+        robot_name, extracted = extractplus.extract(file, jobs)
+        extracted = list(extracted)
+    phase('extract', json.dumps(extracted))
+    declarations = extractplus.build_declarations(extracted)
+    phase('fix_weirdness', extractplus.render_declarations(declarations))
+    header = extractplus.render_header(extractplus.controller_macros(robot_name), declarations)
+    phase('render', header)
+    symbols = extractplus.symbol_records(declarations)
+    phase('symbols', json.dumps(symbols))
+    return {'phases': phases, 'peak_rss': peak_rss()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks main.py on synthetic manuals')
+    parser.add_argument('-s', '--scale', type=float, nargs='+', default=[1, 10, 50],
+                        help='sizes of the manuals relative to the real one (default: 1 10 50)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs per size; the fastest is reported for each phase (default: 3)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='passed on as main.py --jobs (default: 1)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--measure', metavar='FILE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        json.dump(measure(args.measure, args.jobs), sys.stdout)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scale:
+            path = os.path.join(directory, f'manual-{scale}.html')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(generate(scale))
+            runs = [json.loads(subprocess.run([sys.executable, __file__, '--jobs', str(args.jobs), '--measure', path],
+                                              stdout=subprocess.PIPE, check=True).stdout)
+                    for _ in range(args.repeat)]
+            results.append({
+                'scale': scale,
+                'bytes': os.path.getsize(path),
+                'peak_rss': max(run['peak_rss'] for run in runs),
+                'phases': [{'phase': phase, 'seconds': min(run['phases'][i][1] for run in runs), 'sha256': output_hash}
+                           for i, (phase, _, output_hash) in enumerate(runs[0]['phases'])],
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{"scale":>6}  {"phase":<14} {"seconds":>9}  sha256')
+    for result in results:
+        for phase in result['phases']:
+            print(f'{result["scale"]:>6g}  {phase["phase"]:<14} {phase["seconds"]:9.4f}  {phase["sha256"][:16]}')
+        print(f'{result["scale"]:>6g}  peak RSS of the run: {result["peak_rss"] / (1 << 20):.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Checks that the header generated from a manual, or merged from several, compiles, and optionally that it matches a
+golden copy.
+
+The header is compiled with `gcc -fsyntax-only` once per controller macro, concurrently. When a compile fails, the
+declarations are bisected in parallel: several prefixes of the declaration list are compiled at once, narrowing down
+to the first declaration whose addition breaks the header. That declaration is reported with its manual page."""
+
+import argparse
+import difflib
+import io
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as extractplus  # noqa: E402
+from generate import DECLARATION_NAMES, generate  # noqa: E402
+
+# lines of gcc output shown for each failure
+ERROR_LINES = 10
+
+
+class Compiler:
+    """Compiles headers in `directory` with `command`, which gets `-D<macro>` and a source including the header
+    appended"""
+
+    def __init__(self, command: List[str], directory: str):
+        self.command = command
+        self.directory = directory
+
+    def check(self, header: str, macro: str, name: str) -> Tuple[bool, str]:
+        """Compiles `header`, returning whether it compiled and gcc's messages"""
+        path = os.path.join(self.directory, f'{name}-{macro}')
+        with open(path + '.h', 'w', encoding='utf-8') as file:
+            file.write(header)
+        with open(path + '.c', 'w', encoding='utf-8') as file:
+            file.write(f'#include "{name}-{macro}.h"\n')
+        result = subprocess.run(self.command + [f'-D{macro}', path + '.c'], stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, encoding='utf-8', errors='replace')
+        return result.returncode == 0, result.stdout
+
+
+def first_failure(compiler: Compiler, pool: ThreadPoolExecutor, workers: int, macros: List[str], macro: str,
+                  declarations: List[extractplus.Declaration]) -> Tuple[Optional[int], str]:
+    """Finds the first declaration that the header fails to compile with, returning its index (or None if the header
+    fails without any declaration) and gcc's messages for the prefix ending with it"""
+
+    def check(count: int) -> Tuple[bool, str]:
+        return compiler.check(extractplus.render_header(macros, declarations[:count]), macro, f'prefix{count}')
+
+    passed, messages = check(0)
+    if not passed:
+        return None, messages
+    # the first `low` declarations compile, the first `high` don't
+    low = 0
+    high = len(declarations)
+    failure = ''
+    while high - low > 1:
+        points = sorted({low + (high - low) * k // (workers + 1) for k in range(1, workers + 1)} - {low, high})
+        for count, (passed, messages) in zip(points, pool.map(check, points)):
+            if not passed:
+                high = count
+                failure = messages
+                break
+            low = count
+    if not failure:
+        _, failure = check(high)
+    return high - 1, failure
+
+
+def report(macro: str, index: Optional[int], messages: str, declarations: List[extractplus.Declaration]) -> str:
+    lines = [f'{macro}: ']
+    if index is None:
+        lines[0] += 'the header fails to compile without any extracted declaration'
+    else:
+        declaration = declarations[index]
+        lines[0] += f'broken by declaration {index + 1} of {len(declarations)}, from page {declaration.page}'
+        lines += ['    ' + line for line in declaration.text.strip().splitlines()]
+    lines += ['  ' + line for line in messages.splitlines()[:ERROR_LINES]]
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compiles the header generated from a manual for every controller, '
+                                                 'and finds the declaration that breaks it')
+    parser.add_argument('inputs', nargs='*', metavar='input',
+                        help='the manuals, as PDFs or pdftohtml output, merged into one header if several (default: '
+                             'generated synthetic manuals)')
+    parser.add_argument('-s', '--scale', type=float, default=0.2,
+                        help='size of the synthetic manual relative to the real one (default: 0.2)')
+    parser.add_argument('--robots', nargs='+', default=['YRC1000'], metavar='NAME',
+                        help='the controllers to generate synthetic manuals for, merged into one header if several; '
+                             'one of their structs differs (default: YRC1000)')
+    parser.add_argument('--golden', metavar='FILE', help='also require the header to be identical to FILE')
+    parser.add_argument('--update', action='store_true', help='write the header to the --golden FILE instead')
+    parser.add_argument('--cc', default='gcc', help='the compiler (default: gcc)')
+    parser.add_argument('--cflags', default='-m32',
+                        help='extra compiler flags, besides -fsyntax-only and the controller macro (default: -m32)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='compilers to run at once while bisecting (default: one per core)')
+    args = parser.parse_args()
+
+    manuals = []
+    for path in args.inputs:
+        with extractplus.open_input(path) as file:
+            robot_name, extracted = extractplus.extract(file)
+            manuals.append((robot_name, extractplus.build_declarations(extracted)))
+    if not args.inputs:
+        for robot in args.robots:
+            robot_name, extracted = extractplus.extract(io.StringIO(generate(args.scale, robot=robot)))
+            manuals.append((robot_name, extractplus.build_declarations(extracted)))
+    macros, declarations = extractplus.merge_manuals(manuals)
+    header = extractplus.render_header(macros, declarations)
+
+    status = 0
+    missing = [name for name in DECLARATION_NAMES if name not in header] if not args.inputs else []
+    if missing:
+        print(f'the header has no synthetic declarations named {", ".join(name + "*" for name in missing)}')
+        status = 1
+    if args.golden and args.update:
+        extractplus.write_if_changed(args.golden, header)
+    elif args.golden:
+        with open(args.golden, encoding='utf-8') as file:
+            golden = file.read()
+        if golden != header:
+            diff = list(difflib.unified_diff(golden.splitlines(), header.splitlines(), args.golden, 'generated',
+                                             lineterm=''))
+            print(f'the header differs from {args.golden}:')
+            print('\n'.join(diff[:100]))
+            status = 1
+
+    command = [args.cc, '-fsyntax-only'] + shlex.split(args.cflags)
+    with tempfile.TemporaryDirectory() as directory, \
+            ThreadPoolExecutor(len(macros)) as controllers, ThreadPoolExecutor(max(args.jobs, 1)) as pool:
+        compiler = Compiler(command, directory)
+        results = list(controllers.map(lambda macro: compiler.check(header, macro, 'header'), macros))
+        failed = [macro for macro, (passed, _) in zip(macros, results) if not passed]
+        # each failing controller gets an even share of the compilers
+        workers = max(1, args.jobs // max(len(failed), 1))
+        failures = list(controllers.map(
+            lambda macro: first_failure(compiler, pool, workers, macros, macro, declarations), failed))
+    for macro, (passed, _) in zip(macros, results):
+        if passed:
+            print(f'{macro}: ok')
+    for macro, (index, messages) in zip(failed, failures):
+        print(report(macro, index, messages, declarations))
+        status = 1
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
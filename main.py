@@ -32,28 +32,65 @@
 # Strings embedded in this file may not be under this license.
 
 
+import argparse
+import ast
+import bisect
+import functools
+import hashlib
+import importlib.util
+import inspect
+import io
+import itertools
+import json
+import linecache
+import math
+import mmap
+import operator
+import os
 import re
+import shutil
+import sqlite3
+import struct
+import subprocess
 import sys
-from itertools import islice
-from typing import Callable
-
-from bs4 import BeautifulSoup
+import tempfile
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple, Union
 
 SIM_LEFT_PAREN = '❨'
 SIM_COMMA = 'ꓹ'
 STARTS_WITH_COMMENT = re.compile(r'^\w+:', re.MULTILINE)
-ALL_STRUCTS = re.compile(r'struct\s+(\w+)\s*{[^}]+}\s*;')
-ALL_TYPEDEF_STRUCTS = re.compile(r'typedef\s+(?:struct|enum|union)\s*{[^}]+}\s*(\w+)\s*;')
-SIMPLE_TYPEDEF = re.compile(r'typedef\s+(?!struct|enum|union)([^;])+;')
-FRONT_TYPES = ['MP_GRP_POS_INFO', 'MP_P_VAR_BUFF', 'MP_ALARM_DATA', 'MP_MOV_CTRL_DATA', 'MP_JOB_POS_DATA',
-               'MP_INTP_TYPE', 'MP_POS', 'MP_POS_TAG', 'MP_TRQLMT_RANGE', 'dirent', 'DIR']
-FRONT_TYPES_RE = re.compile(
-    r'typedef\s+(?:struct|enum|union)\s*{[^}]+}\s*(?:' + '|'.join(FRONT_TYPES) + r')\s*;')
-DIRENT = re.compile(r'struct\s+dirent\s*{[^}]+}\s*;')
+COMMENT = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+DOC_COMMENT = re.compile(r'/\*\*(.*?)\*/', re.DOTALL)
+IDENTIFIER = re.compile(r'\b[A-Za-z_]\w*')
+DEFINE_NAME = re.compile(r'\s*#\s*define\s+(\w+)')
+TAG_NAME = re.compile(r'\b(?:struct|union|enum)\s+(\w+)\s*{')
+ENUM_BODY = re.compile(r'\benum\b[^{;]*{([^}]*)}')
+ENUM_CONSTANT = re.compile(r'(?:^|,)\s*([A-Za-z_]\w*)')
+TYPEDEF = re.compile(r'\s*typedef\b')
+TYPE_BODY = re.compile(r'\b(struct|union|enum)\b\s*(\w*)\s*{')
+FUNCTION_NAME = re.compile(r'(\w+)\s*\(')
+FUNCTION_POINTER_NAME = re.compile(r'\(\s*\*\s*(\w+)\s*\)')
+BRACKETS = re.compile(r'\[[^\]]*\]')
+DEFINE_VALUE = re.compile(r'\s*#\s*define\s+(\w+)\s+(.+)', re.DOTALL)
+MEMBER_DECLARATOR = re.compile(r'(\**)\s*(\w+)\s*((?:\[[^\]]*\]\s*)*)$')
+ARRAY_DIMENSION = re.compile(r'\[([^\]]*)\]')
+TYPE_QUALIFIER = re.compile(r'\b(?:const|CONST|volatile|register)\b')
+INTEGER_SUFFIX = re.compile(r'\b(0[xX][0-9a-fA-F]+|\d+)[uUlL]+\b')
+OCTAL_LITERAL = re.compile(r'\b0([0-7]+)\b')
+INCLUDE_GUARD = re.compile(r'\W')
+DECLARATION_TOKEN = re.compile(r'/\*|//|["\'{};]|^[ \t]*#', re.MULTILINE)
 REMOVE_NOTES = re.compile(r'\[[^[]+]')
 FIX_DEFINES = re.compile(r'#define *([^\s(]+)\s*([^;\n]*);?')
 FIX_DEFINE_PAREN = re.compile(r'#define (\w+) \((\d+)\)')
-FIX_MISSING_COMMA = re.compile(r'((?:const\s+)?\w+\s*\*\s*\w+)\s+((?:const\s+)?\w+\s*\*)')
+# only tried at the start of a word, which finds the same matches without backtracking through every word
+FIX_MISSING_COMMA = re.compile(r'(?<!\w)((?:const\s+)?\w+\s*\*\s*\w+)\s+((?:const\s+)?\w+\s*\*)')
 FIX_RESERVED = re.compile(r'reserved (\d)')
 FIX_MISSING_BRACE = re.compile(r'typedef\s+struct\s+([^{\s])')
 FIX_STRUCT_COMMA = re.compile(r'typedef\s+struct\s*{\s*int\s+id,')
@@ -63,11 +100,67 @@ RENAME_MP_RS_SEND = re.compile(r'int\s+mpRsClose(\([^)]+buf_len\s+\);)')
 RENAME_CART_POS_EX = re.compile(r'LONG\s+mpGetCartPos\s+(\(\s+MP_CARTPOS_EX[^)]+\);)')
 REMOVE_MP_COORD = re.compile(r'typedef\s+struct\s*{[^}]+}\s*MP_COORD\s*;')
 REMOVE_MP_CLOSE = re.compile(r'LONG\s+mpClose\([^)]+\)\s*;')
-
-
-def nth(iterable, n, default=None):
-    """Returns the 0-indexed nth item or a default value"""
-    return next(islice(iterable, n, None), default)
+# Text that a syntax block follows. Plain substrings, so that testing every text node is a couple of `in` checks
+SYNTAX_ANCHORS = ('Syntax:', 'multiple control groups).')
+# Bytes that every page with a declaration contains, searched for without parsing. `Syntax` is part of both `Syntax:`
+# runs and bold `Syntax` headers.
+ANCHOR_BYTES = (b'Syntax', b'multiple control groups).')
+PAGE_BREAK_BYTES = b'<hr'
+# Tags that html.parser never expects a closing tag for
+VOID_TAGS = frozenset({'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image',
+                       'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source',
+                       'spacer', 'track', 'wbr'})
+ASCII_SPACES = ' \n\t\x0c\r'
+CHUNK_SIZE = 1 << 16
+# Pages are a few kilobytes, and the region a declaration anchors should be parsed without much of what follows it
+REGION_CHUNK_SIZE = 1 << 12
+PDF_MAGIC = b'%PDF-'
+# Pages past the end of a shard that a worker may read to finish a declaration
+SHARD_OVERLAP_PAGES = 2
+SHARDS_PER_JOB = 4
+RANGES_PER_JOB = 2
+PDFINFO_PAGES = re.compile(r'^Pages:\s+(\d+)', re.MULTILINE)
+PDFTOHTML = ['pdftohtml', '-q', '-i', '-noframes', '-stdout']
+PDFTOHTML_MISSING = 'pdftohtml was not found. It is usually provided by poppler or poppler-utils.'
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+SOURCE_SUFFIXES = ('.c', '.h')
+HEADER_NAME = 'MotoPlus.h'
+# Functions and macros by the API family they belong to, for --split. Each family gets its own header.
+API_FAMILIES = [
+    ('socket', re.compile(r'mp(Socket|Bind|Listen|Accept|Connect|Send|SendTo|Recv|RecvFrom|Select|Shutdown|'
+                          r'[GS]etsockopt|Inet\w+|Hton[ls]|Ntoh[ls]|GetHostByName)|FD_(ZERO|SET|CLR|ISSET)')),
+    ('serial', re.compile(r'mpRs\w+')),
+    ('file', re.compile(r'mp(Create|Open|Close|Read|Write|Lseek|Remove|Rename|Fstat|Stat|Ioctl|Fd\w+|\w*File\w*)')),
+    ('io', re.compile(r'mp\w*(IO|Io)\w*')),
+    ('variable', re.compile(r'mp\w*Var\w*')),
+    ('motion', re.compile(r'mp(Mot\w+|Conv\w+|\w*(Pos|IncrementMove|Servo|Torque|Tool|Speed|Coord)\w*)')),
+    ('job', re.compile(r'mp(Hold|\w*(Job|Cycle|Step)\w*)')),
+    ('task', re.compile(r'mp(Sem\w+|MsgQ\w+|Clk\w+|Wdg\w+|Svs\w+|Tick\w*|Malloc|Free|\w*(Task|Delay)\w*)')),
+    ('alarm', re.compile(r'mp\w*(Alarm|Error)\w*')),
+]
+# the family of the types and constants that several families use, with the preamble
+COMMON_FAMILY = 'types'
+# the family of functions that no other one matches
+OTHER_FAMILY = 'system'
+# Seconds between checks for changed files with --watch
+WATCH_INTERVAL = 0.5
+SYMBOLS_SCHEMA = '''
+CREATE TABLE symbols (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    page INTEGER,
+    docs TEXT NOT NULL,
+    declaration TEXT NOT NULL,
+    controllers TEXT
+);
+CREATE TABLE names (
+    name TEXT NOT NULL,
+    symbol INTEGER NOT NULL REFERENCES symbols (id)
+);
+CREATE INDEX symbols_name ON symbols (name);
+CREATE INDEX names_name ON names (name);
+'''
 
 
 def remove_prefix(text, prefix, default=''):
@@ -76,108 +169,658 @@ def remove_prefix(text, prefix, default=''):
     return default
 
 
-def find_syntax_headers(document: BeautifulSoup):
-    return filter(lambda item: item.text == 'Syntax', document.find_all('b'))
+class Stats:
+    """Wall time and peak traced memory of each phase, the match count and time of each fix-up rule, and counts of
+    things processed.
+
+    Time and memory are charged to the innermost running phase, so phases that interleave, like parsing and
+    extraction, are measured separately. Does nothing unless `enabled`."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.phases = {}
+        self.rules = {}
+        self.counts = {}
+        self.running = []
+        self.mark = time.perf_counter()
+        if enabled:
+            tracemalloc.start()
+
+    def switch(self):
+        now = time.perf_counter()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        if self.running:
+            phase = self.phases.setdefault(self.running[-1], {'seconds': 0.0, 'peak_bytes': 0})
+            phase['seconds'] += now - self.mark
+            phase['peak_bytes'] = max(phase['peak_bytes'], peak)
+        self.mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        self.switch()
+        self.running.append(name)
+        try:
+            yield
+        finally:
+            self.switch()
+            self.running.pop()
+
+    def count(self, name: str, n: int):
+        """Adds `n` to a count of things processed, such as pages parsed"""
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def rule(self, name: str):
+        """Times a fix-up rule. Its match count may be stored in the yielded record."""
+        record = {'matches': None, 'seconds': 0.0}
+        start = time.perf_counter()
+        yield record
+        if self.enabled:
+            self.rules[name] = record
+            record['seconds'] = time.perf_counter() - start
+
+    def json(self) -> str:
+        return json.dumps({'phases': self.phases, 'rules': self.rules, 'counts': self.counts}, indent=2)
+
+    def text(self) -> str:
+        lines = [f'{"phase":<24}{"seconds":>10}{"peak MiB":>10}']
+        for name, phase in self.phases.items():
+            lines.append(f'{name:<24}{phase["seconds"]:>10.4f}{phase["peak_bytes"] / (1 << 20):>10.1f}')
+        lines.append('')
+        lines.append(f'{"rule":<24}{"matches":>10}{"seconds":>10}')
+        for name, rule in self.rules.items():
+            matches = '-' if rule['matches'] is None else rule['matches']
+            lines.append(f'{name:<24}{matches:>10}{rule["seconds"]:>10.4f}')
+        if self.counts:
+            lines.append('')
+            lines += [f'{name:<24}{count:>10}' for name, count in self.counts.items()]
+        return '\n'.join(lines)
+
+
+NO_STATS = Stats()
+
+
+class Token(NamedTuple):
+    """A top-level node of the document body: a text run, or a tag such as `<b>`, `<br>` or an `<hr>` page break"""
+    # tag name, or None for text
+    name: Optional[str]
+    # text content, as it would be rendered
+    text: str
+    # whether this is, or contains, a `<b>` tag
+    bold: bool
+    # whether its serialization (text, comments and attribute values) contains a colon, which ends a `Syntax:` block
+    colon: bool
+    # whether its serialization contains a U+F06E bullet, which ends either kind of syntax block
+    bullet: bool
+    # whether this is text that a `Syntax:` block starts at
+    anchor: bool
+    # page of the manual, counting `<hr>` page breaks from 1
+    page: int
+
+
+class BodyParser(HTMLParser):
+    """Incrementally splits pdftohtml output into the top-level nodes of its body, without building a tree.
+
+    Text is grouped into nodes exactly as BeautifulSoup's html.parser builder would group it. Parsing may also start
+    right after the `<hr>` that ends the page before `page`, inside the body."""
+
+    def __init__(self, page: int = 1):
+        super().__init__(convert_charrefs=True)
+        self.tokens = deque()
+        # first non-blank string in the body
+        self.first_text = None
+        self.state = 'head' if page == 1 else 'body'
+        self.pending = []
+        self.closed_void = []
+        self.stack = []
+        self.node_text = []
+        self.node_markup = []
+        self.node_bold = False
+        self.page = page
+
+    def flush(self, comment=False):
+        if not self.pending:
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        if not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        if self.state != 'body':
+            return
+        if self.first_text is None and data.strip():
+            self.first_text = data
+        if self.stack:
+            if not comment:
+                self.node_text.append(data)
+            self.node_markup.append(data)
+        else:
+            self.tokens.append(Token(None, '' if comment else data, False, ':' in data, '\uf06e' in data,
+                                     any(anchor in data for anchor in SYNTAX_ANCHORS), self.page))
+
+    def open_tag(self, tag: str, attrs):
+        self.flush()
+        if self.state != 'body':
+            if tag == 'body' and self.state == 'head':
+                self.state = 'body'
+            return
+        if not self.stack:
+            self.node_text = []
+            self.node_markup = []
+            self.node_bold = False
+        self.stack.append(tag)
+        self.node_bold = self.node_bold or tag == 'b'
+        for key, value in attrs:
+            self.node_markup.append(key)
+            self.node_markup.append(value or '')
 
+    def close_tag(self, tag: str):
+        if tag in self.stack:
+            del self.stack[len(self.stack) - 1 - self.stack[::-1].index(tag):]
+            if not self.stack:
+                self.emit(tag)
+        elif tag in ('body', 'html') and self.state == 'body':
+            if self.stack:
+                self.emit(self.stack[0])
+                self.stack = []
+            self.state = 'tail'
 
-def has_child_of_type(root, tag: str) -> bool:
-    if root.name == tag:
+    def emit(self, tag: str):
+        markup = ''.join(self.node_markup)
+        self.tokens.append(Token(tag, ''.join(self.node_text), self.node_bold, ':' in markup, '\uf06e' in markup, False,
+                                 self.page))
+        if tag == 'hr':
+            self.page += 1
+
+    def handle_starttag(self, tag, attrs):
+        self.open_tag(tag, attrs)
+        if tag in VOID_TAGS:
+            self.close_tag(tag)
+            self.closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.open_tag(tag, attrs)
+        self.close_tag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void:
+            self.closed_void.remove(tag)
+            return
+        self.flush()
+        self.close_tag(tag)
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_comment(self, data):
+        self.flush()
+        self.pending.append(data)
+        self.flush(comment=True)
+
+
+class Document:
+    """A sliding window over the top-level body nodes of a pdftohtml document, read from `file` as needed.
+
+    Nodes are addressed by their absolute index; nodes before the last `release` are forgotten. `file` may also start
+    at the beginning of `page`, in which case index 0 is the first node of that page."""
+
+    def __init__(self, file: TextIO, stats: Stats = NO_STATS, page: int = 1, chunk_size: int = CHUNK_SIZE):
+        self.file = file
+        self.stats = stats
+        self.chunk_size = chunk_size
+        self.parser = BodyParser(page)
+        self.window = deque()
+        self.offset = 0
+        self.eof = False
+
+    def read(self) -> bool:
+        if self.eof:
+            return False
+        with self.stats.phase('parse'):
+            chunk = self.file.read(self.chunk_size)
+            if chunk:
+                self.parser.feed(chunk)
+            else:
+                self.parser.close()
+                self.parser.flush()
+                self.eof = True
+        self.window.extend(self.parser.tokens)
+        self.parser.tokens.clear()
         return True
-    if hasattr(root, 'children'):
-        return next(filter(lambda child: has_child_of_type(child, tag), root.children), None) is not None
-    return False
 
+    def __getitem__(self, i: int) -> Optional[Token]:
+        while i - self.offset >= len(self.window):
+            if not self.read():
+                return None
+        return self.window[i - self.offset]
 
-def index(l: [str], f: Callable[[str], bool]) -> int:
-    return next((i for i, v in enumerate(iter(l)) if f(v)), -1)
+    def release(self, i: int):
+        """Forget every node before index `i`"""
+        while self.offset < i and self.window:
+            self.window.popleft()
+            self.offset += 1
 
+    def first_text(self) -> Optional[str]:
+        while self.parser.first_text is None and self.read():
+            pass
+        return self.parser.first_text
 
-def dedup_lines(lines: [str]) -> [str]:
-    new_list = []
-    seen = set()
-    for item in lines:
-        if item not in seen:
-            new_list.append(item)
-            seen.add(item)
-    return new_list
-
-
-def remove_duplicate_matches(text: str, regex) -> str:
-    structs = {}
-    for match in regex.finditer(text):
-        name = match.group(1)
-        structs[name] = structs.get(name, 0) + 1
-    for name, occurrences in structs.items():
-        if occurrences > 1:
-            spans = []
-            for match in regex.finditer(text):
-                if match.group(1) == name:
-                    spans.append((match.start(), match.end()))
-            for i in range(len(spans) - 1, 0, -1):
-                text = text[:spans[i][0]] + text[spans[i][1]:]
-    return text
+    def __iter__(self) -> Iterator[Token]:
+        """Yields the remaining nodes, releasing each one"""
+        i = self.offset
+        while (token := self[i]) is not None:
+            yield token
+            i += 1
+            self.release(i)
 
 
-def dedup_structs(text: str):
-    text = remove_duplicate_matches(text, ALL_STRUCTS)
-    text = remove_duplicate_matches(text, ALL_TYPEDEF_STRUCTS)
-    return text
+class ShardOverrun(Exception):
+    """A declaration continued past the end of the shard it started in"""
+
+
+class Shard:
+    """A run of whole pages of the body nodes, starting at absolute index `offset`, for extraction in a worker.
+
+    `complete` is set when the shard reaches the end of the document."""
+
+    def __init__(self, tokens: List[Token], offset: int, complete: bool):
+        self.tokens = tokens
+        self.offset = offset
+        self.complete = complete
+
+    def __getitem__(self, i: int) -> Optional[Token]:
+        if i - self.offset < len(self.tokens):
+            return self.tokens[i - self.offset]
+        if self.complete:
+            return None
+        raise ShardOverrun()
+
+    def release(self, i: int):
+        pass
 
 
-def move_to_top(lines: [str], matches: Callable[[str], bool]):
-    for i in range(len(lines) - 1, -1, -1):
-        if matches(lines[i]):
-            lines.insert(0, lines.pop(i))
+def is_syntax_header(token: Token) -> bool:
+    return token.name == 'b' and token.text == 'Syntax'
 
 
-def move_typedefs(text: str) -> str:
-    for match in FRONT_TYPES_RE.finditer(text):
-        text = match.group(0) + text[:match.start()] + text[match.end():]
-    for match in DIRENT.finditer(text):
-        text = match.group(0) + text[:match.start()] + text[match.end():]
-    for match in SIMPLE_TYPEDEF.finditer(text):
-        text = match.group(0) + text[:match.start()] + text[match.end():]
+def substitute(pattern: re.Pattern, replace: str, text: str, starts: List[int], template=True) -> Tuple[str, int]:
+    """Like `pattern.subn`, also moving the sorted offsets in `starts` along with the text they point at.
+
+    An offset inside a match moves to the start of its replacement. `replace` is used as is unless `template` is set."""
+    pieces = []
+    last = 0
+    shift = 0
+    j = 0
+    for match in pattern.finditer(text):
+        while j < len(starts) and starts[j] < match.end():
+            starts[j] = min(starts[j], match.start()) + shift
+            j += 1
+        replacement = match.expand(replace) if template else replace
+        pieces.append(text[last:match.start()])
+        pieces.append(replacement)
+        shift += len(replacement) - (match.end() - match.start())
+        last = match.end()
+    if not pieces:
+        return text, 0
+    for j in range(j, len(starts)):
+        starts[j] += shift
+    pieces.append(text[last:])
+    return ''.join(pieces), len(pieces) // 2
+
+
+def fix_defines(text: str, starts: List[int]) -> str:
+    text, _ = substitute(FIX_DEFINES, r'\n#define \1 \2', text, starts)
+    text, _ = substitute(FIX_DEFINE_PAREN, r'#define \1 \2', text, starts)
     return text
 
 
-def fix_defines(text: str) -> str:
-    text = FIX_DEFINES.sub(r'\n#define \1 \2', text)
-    text = FIX_DEFINE_PAREN.sub(r'#define \1 \2', text)
-    lines = text.splitlines()
-    move_to_top(lines, lambda line: line.startswith('#define'))
+def preprocessor_line_end(text: str, i: int) -> int:
+    while True:
+        i = text.find('\n', i)
+        if i < 0:
+            return len(text)
+        if text[i - 1] != '\\':
+            return i
+        i += 1
+
+
+def split_declarations(text: str) -> Tuple[List[Tuple[int, bool, str]], str]:
+    """Splits C source into top-level declarations, each with the comments and whitespace in front of it.
+
+    Preprocessor lines always become declarations of their own, even in the middle of another declaration.
+    Returns the declarations, each with the offset where it ends and whether it was inside braces, and whatever
+    follows the last one."""
+    declarations = []
+    pending = []
+    start = 0
+    depth = 0
+    i = 0
+    while match := DECLARATION_TOKEN.search(text, i):
+        token = match.group()
+        i = match.end()
+        if token == '/*':
+            end = text.find('*/', i)
+            i = len(text) if end < 0 else end + 2
+        elif token == '//':
+            end = text.find('\n', i)
+            i = len(text) if end < 0 else end
+        elif token == '"' or token == "'":
+            while i < len(text) and text[i] not in (token, '\n'):
+                i += 2 if text[i] == '\\' else 1
+            i += 1
+        elif token == '{':
+            depth += 1
+        elif token == '}':
+            depth = max(depth - 1, 0)
+        elif token == ';':
+            if depth == 0:
+                pending.append(text[start:i])
+                declarations.append((i, False, ''.join(pending)))
+                pending = []
+                start = i
+        else:
+            begin = max(start, match.start())
+            i = preprocessor_line_end(text, i)
+            pending.append(text[start:begin])
+            declarations.append((i, depth > 0, text[begin:i]))
+            start = i
+    pending.append(text[start:])
+    return declarations, ''.join(pending)
+
+
+def typedef_names(code: str) -> List[str]:
+    """Finds the names declared by a typedef without comments"""
+    tail = code[code.rfind('}') + 1:]
+    function_pointer = FUNCTION_POINTER_NAME.search(tail)
+    if function_pointer:
+        return [function_pointer.group(1)]
+    declarators = IDENTIFIER.findall(BRACKETS.sub('', tail))
+    return declarators if '}' in code else declarators[-1:]
+
+
+def declared_names(code: str) -> List[str]:
+    """Finds the macros, tags, enum constants and typedef names declared by a declaration without comments"""
+    define = DEFINE_NAME.match(code)
+    if define:
+        return [define.group(1)]
+    names = TAG_NAME.findall(code)
+    for body in ENUM_BODY.findall(code):
+        names += ENUM_CONSTANT.findall(body)
+    if TYPEDEF.match(code):
+        names += typedef_names(code)
+    return names
+
+
+class Declaration:
+    """A top-level declaration of the header, with the comments in front of it and the manual page it came from.
+
+    `names` are the macros, tags, enum constants and typedef names it declares, `name` the one it is known by and
+    `docs` the text of its `/** */` comments. `nested` are the preprocessor lines that were taken out of its braces.
+    `controllers` are the macros of the controllers it is declared for, when it is not declared for all of them.
+    `kind` names the kind of symbol it is in the symbol database, if it is one."""
+    __slots__ = ('text', 'page', 'name', 'names', 'docs', 'nested', 'controllers')
+    kind = None
+
+    def __init__(self, text: str, page: Optional[int], name: Optional[str], names: List[str]):
+        self.text = text
+        self.page = page
+        self.name = name
+        self.names = names
+        self.docs = [doc.strip() for doc in DOC_COMMENT.findall(text)]
+        self.nested = []
+        self.controllers = None
+
+    def code(self) -> str:
+        return COMMENT.sub(' ', self.text)
+
+    def references(self) -> List[str]:
+        return IDENTIFIER.findall(self.code())
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r}, page={self.page})'
+
+
+class Directive(Declaration):
+    """A preprocessor line other than a `#define`"""
+    __slots__ = ()
+
+
+class Define(Declaration):
+    __slots__ = ()
+    kind = 'define'
+
+
+class Typedef(Declaration):
+    """A typedef of an existing type or of a function pointer"""
+    __slots__ = ()
+    kind = 'typedef'
+
+
+class Struct(Declaration):
+    """A struct or union definition, possibly typedef'd"""
+    __slots__ = ()
+    kind = 'struct'
+
+
+class Enum(Declaration):
+    """An enum definition, possibly typedef'd"""
+    __slots__ = ()
+    kind = 'enum'
+
+
+class Prototype(Declaration):
+    __slots__ = ()
+    kind = 'function'
+
+
+def parse_declaration(text: str, page: Optional[int] = None) -> Declaration:
+    code = COMMENT.sub(' ', text)
+    names = declared_names(code)
+    if DEFINE_NAME.match(code):
+        return Define(text, page, names[0], names)
+    if code.lstrip().startswith('#'):
+        return Directive(text, page, None, names)
+    body = TYPE_BODY.search(code)
+    if body:
+        typedefs = typedef_names(code) if TYPEDEF.match(code) else []
+        name = typedefs[0] if typedefs else body.group(2) or None
+        return (Enum if body.group(1) == 'enum' else Struct)(text, page, name, names)
+    if TYPEDEF.match(code):
+        return Typedef(text, page, names[-1] if names else None, names)
+    function = FUNCTION_NAME.search(code)
+    if function:
+        return Prototype(text, page, function.group(1), names)
+    return Declaration(text, page, None, names)
+
+
+def parse_declarations(text: str, starts: List[int], pages: List[Optional[int]]) -> List[Declaration]:
+    """Splits the repaired text into declarations. The text from `starts[k]` on came from the manual page `pages[k]`."""
+    split, trailing = split_declarations(text)
+    declarations = []
+    nested = []
+    for end, inside, source in split:
+        declaration = parse_declaration(source, pages[bisect.bisect_right(starts, end - 1) - 1])
+        declarations.append(declaration)
+        if inside:
+            nested.append(declaration)
+        elif not isinstance(declaration, (Define, Directive)):
+            declaration.nested = nested
+            nested = []
+    if trailing.strip():
+        declarations.append(Declaration(trailing.strip(), pages[-1], None, []))
+    return declarations
+
+
+def dedup_declarations(declarations: List[Declaration]) -> List[Declaration]:
+    """Keeps the first of the struct, union and enum definitions of the same type name or tag, and of identical
+    `#define`s. Repeated definitions go together with the preprocessor lines taken out of them. Other preprocessor
+    lines, such as `#endif`, are all kept."""
+    seen = set()
+    dropped = set()
+    for declaration in declarations:
+        if isinstance(declaration, (Struct, Enum)):
+            # typedef names and tags are separate namespaces; anonymous types are told apart by their constants
+            key = (bool(TYPEDEF.match(declaration.code())), declaration.name or tuple(declaration.names))
+            if key in seen:
+                dropped.add(id(declaration))
+                dropped.update(id(line) for line in declaration.nested)
+            seen.add(key)
+    kept = []
+    for declaration in declarations:
+        if id(declaration) in dropped:
+            continue
+        if isinstance(declaration, Define):
+            key = declaration.text.strip()
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(declaration)
+    return kept
+
+
+def order_declarations(declarations: List[Declaration]) -> List[Declaration]:
+    """Reorders declarations so that every macro, tag, enum constant and typedef is declared before it is used.
+    Declarations keep their order unless they must be pulled in front of one that depends on them. A name that
+    merged controllers declare differently has the first declaration of each variant pulled."""
+    declared_by = {}
+    for i, declaration in enumerate(declarations):
+        for name in declaration.names:
+            declared_by.setdefault(name, {}).setdefault(tuple(declaration.controllers or ()), i)
+
+    def dependencies(i: int) -> Iterator[int]:
+        for name in declarations[i].references():
+            for j in declared_by.get(name, {}).values():
+                if j != i:
+                    yield j
+
+    # depth-first, emitting each declaration after everything it depends on; cycles keep their original order
+    visited = [False] * len(declarations)
+    order = []
+    for root in range(len(declarations)):
+        if visited[root]:
+            continue
+        visited[root] = True
+        stack = [(root, dependencies(root))]
+        while stack:
+            i, remaining = stack[-1]
+            for j in remaining:
+                if not visited[j]:
+                    visited[j] = True
+                    stack.append((j, dependencies(j)))
+                    break
+            else:
+                stack.pop()
+                order.append(declarations[i])
+    return order
+
+
+def prune_declarations(declarations: List[Declaration], used: Set[str]) -> List[Declaration]:
+    """Keeps only the declarations of the names in `used` and everything they depend on, besides preprocessor lines
+    other than `#define`s"""
+    declared_by = {}
+    for i, declaration in enumerate(declarations):
+        for name in dict.fromkeys(declaration.names + [declaration.name]):
+            declared_by.setdefault(name, []).append(i)
+    keep = [False] * len(declarations)
+    stack = [i for name in used for i in declared_by.get(name, ())]
+    while stack:
+        i = stack.pop()
+        if keep[i]:
+            continue
+        keep[i] = True
+        for name in declarations[i].references():
+            stack += declared_by.get(name, ())
+    return [declaration for declaration, kept in zip(declarations, keep)
+            if kept or isinstance(declaration, Directive)]
 
-    # remove duplicates
-    last_define = len(lines) - index(lines[::-1], lambda x: x.startswith('#define'))
 
-    deduplicated = dedup_lines(lines[:last_define])
-    lines[:len(deduplicated)] = deduplicated
-    del lines[len(deduplicated):last_define]
+def merge_declarations(manuals: Iterable[Tuple[List[str], List[Declaration]]]) -> List[Declaration]:
+    """Merges the declarations for several controllers, each given with the macros that select it. Declarations with
+    the same code, ignoring comments and whitespace, are kept once; the first manual's wording wins. Those that not
+    every controller has are marked with the macros of the ones that do."""
+    merged = {}
+    all_macros = []
+    for macros, declarations in manuals:
+        all_macros += [macro for macro in macros if macro not in all_macros]
+        for declaration in declarations:
+            key = ' '.join(declaration.code().split())
+            first = merged.setdefault(key, declaration)
+            if first is declaration:
+                first.controllers = []
+            first.controllers += [macro for macro in macros if macro not in first.controllers]
+    declarations = list(merged.values())
+    for declaration in declarations:
+        if len(declaration.controllers) == len(all_macros):
+            declaration.controllers = None
+    return order_declarations(declarations)
 
+
+def render_declarations(declarations: Iterable[Declaration]) -> str:
+    """Renders declarations one after another, wrapping each run for the same controllers in an `#if`"""
+    lines = []
+    controllers = None
+    for declaration in declarations:
+        if declaration.controllers != controllers:
+            if controllers:
+                lines.append('#endif')
+            controllers = declaration.controllers
+            if controllers:
+                lines.append('#if ' + ' || '.join(f'defined({macro})' for macro in controllers))
+        lines.append(declaration.text.lstrip())
+    if controllers:
+        lines.append('#endif')
     return '\n'.join(lines)
 
 
-def fix_weirdness(text: str) -> str:
-    text = move_typedefs(text)
-    text = fix_defines(text)
-    text = text.replace('MAX_JOB_MOV_POS _NUM', 'MAX_JOB_MOV_POS_NUM')
-    text = text.replace('_ ', '_')
-    text = text.replace('structLONG', 'struct { LONG')
-    text = text.replace('sTool/No', 'sToolNo')
-    text = text.replace('*.', '*')
-    text = text.replace('MS_COORD', 'MP_COORD')
-    text = text.replace('ox, py, pz', 'px, py, pz')
-    text = FIX_MISSING_COMMA.sub(r'\1, \2', text)
-    text = FIX_RESERVED.sub(r'reserved\1', text)
-    text = FIX_MISSING_BRACE.sub(r'typedef struct { \1', text)
-    text = FIX_STRUCT_COMMA.sub(r'typedef struct { int id;', text)
-    text = FIX_TRAILING_COMMA.sub(r')', text)
-    text = FIX_APPINFO.sub(r'\1} MP_APPINFO_SEND_DATA;', text)
-    text = RENAME_MP_RS_SEND.sub(r'int mpRsSend\1', text)
-    text = RENAME_CART_POS_EX.sub(r'LONG mpGetCartPosEx\1', text)
-    text = REMOVE_MP_COORD.sub(r'', text)
-    text = REMOVE_MP_CLOSE.sub(r'', text)
-    text = dedup_structs(text)
+class Fixup(NamedTuple):
+    """A repair to the extracted text: every occurrence of `find`, a literal or a regex, is replaced"""
+    name: str
+    find: Union[str, re.Pattern]
+    replace: str
+
+
+# Applied in order, after defines are put on lines of their own and before the text is split into declarations
+FIXUPS = [
+    Fixup('MAX_JOB_MOV_POS_NUM', 'MAX_JOB_MOV_POS _NUM', 'MAX_JOB_MOV_POS_NUM'),
+    Fixup('UNDERSCORE_SPACE', '_ ', '_'),
+    Fixup('STRUCT_LONG', 'structLONG', 'struct { LONG'),
+    Fixup('S_TOOL_NO', 'sTool/No', 'sToolNo'),
+    Fixup('POINTER_DOT', '*.', '*'),
+    Fixup('MS_COORD', 'MS_COORD', 'MP_COORD'),
+    Fixup('OX_PY_PZ', 'ox, py, pz', 'px, py, pz'),
+    Fixup('FIX_MISSING_COMMA', FIX_MISSING_COMMA, r'\1, \2'),
+    Fixup('FIX_RESERVED', FIX_RESERVED, r'reserved\1'),
+    Fixup('FIX_MISSING_BRACE', FIX_MISSING_BRACE, r'typedef struct { \1'),
+    Fixup('FIX_STRUCT_COMMA', FIX_STRUCT_COMMA, r'typedef struct { int id;'),
+    Fixup('FIX_TRAILING_COMMA', FIX_TRAILING_COMMA, r')'),
+    Fixup('FIX_APPINFO', FIX_APPINFO, r'\1} MP_APPINFO_SEND_DATA;'),
+    Fixup('RENAME_MP_RS_SEND', RENAME_MP_RS_SEND, r'int mpRsSend\1'),
+    Fixup('RENAME_CART_POS_EX', RENAME_CART_POS_EX, r'LONG mpGetCartPosEx\1'),
+    Fixup('REMOVE_MP_COORD', REMOVE_MP_COORD, r''),
+    Fixup('REMOVE_MP_CLOSE', REMOVE_MP_CLOSE, r''),
+]
 
+
+def apply_fixup(text: str, fixup: Fixup, starts: List[int]) -> Tuple[str, int]:
+    """Applies `fixup`, moving the offsets in `starts` along, and returns the new text and the number of replacements"""
+    if isinstance(fixup.find, str):
+        if fixup.find not in text:
+            return text, 0
+        return substitute(re.compile(re.escape(fixup.find)), fixup.replace, text, starts, template=False)
+    return substitute(fixup.find, fixup.replace, text, starts)
+
+
+def fix_weirdness(text: str, starts: List[int], stats: Stats = NO_STATS) -> str:
+    """Repairs the mistakes of the manual in the raw text, moving the offsets in `starts` along with the text"""
+    with stats.rule('fix_defines'):
+        text = fix_defines(text, starts)
+    for fixup in FIXUPS:
+        with stats.rule(fixup.name) as record:
+            text, record['matches'] = apply_fixup(text, fixup, starts)
     return text
 
 
@@ -204,13 +847,388 @@ def parse_string(new_text: str, text: str, remove_notes=True) -> str:
     return text
 
 
-def main():
-    if len(sys.argv) != 2:
-        print('You must specify a file', file=sys.stderr)
-        exit(1)
+def extract_syntax(document: Union[Document, Shard], i: int) -> str:
+    """Extracts the declaration following a `Syntax:` text run at index `i`"""
+    text = ''
+    left_over = remove_prefix(document[i].text.strip(), 'Syntax:')
+
+    i += 1
+    ele = document[i]
+    while not ele.colon and not ele.bullet and not ele.bold:
+        if ele.name == 'hr':
+            # skip the page header
+            i += 8
+            ele = document[i]
+        new_text = left_over + ele.text
+        if '<' in new_text:
+            break
+        left_over = ''
+        comment_idx = new_text.find('/*')
+        if comment_idx >= 0:
+            text = parse_string(new_text[:comment_idx], text, remove_notes=False)
+            if new_text.find('*/') < 0:
+                left_over = new_text[comment_idx:]
+            else:
+                text = parse_string(new_text[comment_idx:], text, remove_notes=False)
+        else:
+            text = parse_string(new_text, text, remove_notes=False)
+        i += 1
+        ele = document[i]
+        # skip the page footer
+        if document[i + 6].name == 'hr':
+            i += 6
+            ele = document[i]
+    if not text.strip().endswith(';'):
+        text += ';'
+    text = text.replace(SIM_LEFT_PAREN, '(').replace(SIM_COMMA, ',').replace('\u00a0', ' ')
+    return text.replace('attribute(expansion)', 'attribute (expansion)')
+
+
+def extract_syntax_header(document: Union[Document, Shard], i: int) -> str:
+    """Extracts the declaration following a bold `Syntax` header at index `i`"""
+    text = ''
+
+    i += 1
+    ele = document[i]
+    left_over = ''
+    while not ele.bullet:
+        new_text = left_over + ele.text
+        if STARTS_WITH_COMMENT.search(new_text):
+            break
+        left_over = ''
+        comment_idx = new_text.find('/*')
+        if comment_idx >= 0:
+            text = parse_string(new_text[:comment_idx], text)
+            closing_comment = new_text.find('*/')
+            if closing_comment < 0:
+                left_over = new_text[comment_idx:]
+            else:
+                text = parse_string(new_text[comment_idx:closing_comment + 2], text)
+                text = parse_string(new_text[closing_comment + 2:], text)
+        else:
+            text = parse_string(new_text, text)
+        i += 1
+        ele = document[i]
+    if not text.strip().endswith(';'):
+        text += ';'
+    return text.replace(SIM_LEFT_PAREN, '(').replace(SIM_COMMA, ',').replace('\u00a0', ' ')
+
+
+class Extracted(NamedTuple):
+    """A raw declaration, as extracted from the manual"""
+    # whether it follows a bold `Syntax` header rather than a `Syntax:` text run
+    from_header: bool
+    text: str
+    page: int
+
+
+def extract_at(document: Union[Document, Shard], i: int, stats: Stats = NO_STATS) -> Optional[Extracted]:
+    """Extracts the declaration anchored at index `i`, if any"""
+    token = document[i]
+    if token.anchor:
+        with stats.phase('syntax'):
+            return Extracted(False, extract_syntax(document, i), token.page)
+    elif is_syntax_header(token):
+        with stats.phase('syntax_headers'):
+            return Extracted(True, extract_syntax_header(document, i), token.page)
+    return None
+
+
+def extract_declarations(document: Document, last_page: Optional[int] = None) -> Iterator[Extracted]:
+    """Extracts the declarations anchored in the document, or up to the end of `last_page`"""
+    i = 0
+    while (token := document[i]) is not None and (last_page is None or token.page <= last_page):
+        declaration = extract_at(document, i, document.stats)
+        if declaration:
+            yield declaration
+        i += 1
+        document.release(i)
+
+
+def extract_shard(shard: Shard, end: int) -> List[Tuple[int, Optional[Extracted]]]:
+    """Extracts the declarations anchored before `end`. Those that overrun the shard are returned as None."""
+    declarations = []
+    for i in range(shard.offset, end):
+        try:
+            declaration = extract_at(shard, i)
+        except ShardOverrun:
+            declarations.append((i, None))
+            continue
+        if declaration:
+            declarations.append((i, declaration))
+    return declarations
+
+
+def extract_parallel(document: Document, jobs: int) -> Iterator[Extracted]:
+    """Extracts declarations from groups of pages in a process pool, yielding them in document order"""
+    tokens = list(document)
+    page_starts = [0] + [i + 1 for i, token in enumerate(tokens) if token.name == 'hr']
+    pages_per_shard = max(1, -(-len(page_starts) // (jobs * SHARDS_PER_JOB)))
+    shards = []
+    ends = []
+    for first_page in range(0, len(page_starts), pages_per_shard):
+        start = page_starts[first_page]
+        end_page = first_page + pages_per_shard
+        end = page_starts[end_page] if end_page < len(page_starts) else len(tokens)
+        overlap_page = end_page + SHARD_OVERLAP_PAGES
+        stop = page_starts[overlap_page] if overlap_page < len(page_starts) else len(tokens)
+        shards.append(Shard(tokens[start:stop], start, stop == len(tokens)))
+        ends.append(end)
+
+    whole = Shard(tokens, 0, True)
+    with ProcessPoolExecutor(jobs) as pool:
+        for declarations in pool.map(extract_shard, shards, ends):
+            for i, declaration in declarations:
+                if declaration is None:
+                    declaration = extract_at(whole, i)
+                yield declaration
+
+
+def find_all(data: Union[bytes, mmap.mmap], needle: bytes) -> Iterator[int]:
+    i = data.find(needle)
+    while i >= 0:
+        yield i
+        i = data.find(needle, i + 1)
+
+
+def page_starts(data: Union[bytes, mmap.mmap]) -> List[int]:
+    """Finds the byte offset of each page. Pages start at the beginning of the file and after each `<hr>`."""
+    return [0] + [data.find(b'>', i) + 1 for i in find_all(data, PAGE_BREAK_BYTES)]
+
+
+def anchor_pages(data: Union[bytes, mmap.mmap], starts: List[int]) -> List[int]:
+    """Finds the pages that may contain a declaration anchor"""
+    return sorted({bisect.bisect_right(starts, i) for needle in ANCHOR_BYTES for i in find_all(data, needle)})
+
+
+def page_regions(starts: List[int], pages: List[int]) -> List[Tuple[int, int, int]]:
+    """Groups pages into runs, as the byte offset of the run and its first and last page. Runs one page apart are
+    joined, as the declarations at the end of the first usually take up much of the page between them anyway."""
+    regions = []
+    for page in pages:
+        if regions and regions[-1][2] >= page - 2:
+            regions[-1] = (regions[-1][0], regions[-1][1], page)
+        else:
+            regions.append((starts[page - 1], page, page))
+    return regions
+
+
+def extract_region(path: str, region: Tuple[int, int, int],
+                   stats: Stats = NO_STATS) -> Iterator[Tuple[Extracted, int]]:
+    """Extracts the declarations anchored on a run of pages of an HTML file, as found by `page_regions`, parsing from
+    the start of its first page for only as long as the declarations need. Each comes with the last page that had been
+    parsed when it was extracted, which is as far as it can depend on."""
+    start, first_page, last_page = region
+    with open(path, 'rb') as raw:
+        raw.seek(start)
+        # decoded the way open(path) would, so that the nodes are the same as when the file is parsed whole
+        with io.TextIOWrapper(raw) as file:
+            document = Document(file, stats, first_page, REGION_CHUNK_SIZE)
+            for declaration in extract_declarations(document, last_page):
+                yield declaration, document.window[-1].page
+
+
+def extract_region_list(path: str, region: Tuple[int, int, int]) -> List[Tuple[Extracted, int]]:
+    """`extract_region` for a process pool"""
+    return list(extract_region(path, region))
+
 
-    document = BeautifulSoup(open(sys.argv[1]), 'html.parser')
-    print(r"""#pragma once
+def extract_mapped(path: str, jobs: int = 1, stats: Stats = NO_STATS) -> Iterator[Extracted]:
+    """Extracts declarations from an HTML file without parsing the pages that can't have any, found by searching its
+    memory-mapped bytes"""
+    with stats.phase('prefilter'):
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                starts = page_starts(data)
+                regions = page_regions(starts, anchor_pages(data, starts))
+    for declaration, _ in extract_regions(path, regions, jobs, stats):
+        yield declaration
+
+
+def extract_regions(path: str, regions: List[Tuple[int, int, int]], jobs: int = 1,
+                    stats: Stats = NO_STATS) -> Iterator[Tuple[Extracted, int]]:
+    """Extracts the declarations of the regions of an HTML file in order, in a process pool if `jobs` > 1, and
+    otherwise as they are found"""
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            for declarations in pool.map(extract_region_list, [path] * len(regions), regions,
+                                         chunksize=max(1, len(regions) // (jobs * SHARDS_PER_JOB))):
+                yield from declarations
+    else:
+        for region in regions:
+            yield from extract_region(path, region, stats)
+
+
+def extract_paged(path: str, cache: 'Cache', jobs: int = 1, stats: Stats = NO_STATS) -> Tuple[str, List[Extracted]]:
+    """Extracts the robot name and declarations of an HTML file page by page, reusing what the cache holds for the
+    pages of the last input read for the same robot, such as a previous revision of the manual.
+
+    The declarations anchored on a page are stored under the hash of the page, with the hashes of the pages after it
+    that were parsed to extract them, in one cache entry for all the pages. They are reused while all of those pages
+    are unchanged, so only changed pages and the ones before them whose declarations run into them are parsed
+    again."""
+    with open_input(path) as file:
+        # only the robot name is read until the declarations are iterated
+        robot_name, _ = extract(file, jobs, stats)
+    with stats.phase('prefilter'):
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return robot_name, []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                starts = page_starts(data)
+                hashes = [hashlib.sha256(data[start:end]).hexdigest()
+                          for start, end in zip(starts, starts[1:] + [len(data)])]
+                pages = anchor_pages(data, starts)
+        pages_key = cache_key(extraction_hash(), 'pages', robot_name)
+        stored = cache.get(pages_key, '.pages.json')
+        stored = json.loads(stored) if stored is not None else {}
+        # the first page is parsed from the head of the document
+        keys = {page: f'{page == 1}/{hashes[page - 1]}' for page in pages}
+        found = {}
+        for page in pages:
+            if keys[page] in stored:
+                following, declarations = stored[keys[page]]
+                if hashes[page:page + len(following)] == following:
+                    found[page] = [Extracted(from_header, text, page) for from_header, text in declarations]
+    stale = [page for page in pages if page not in found]
+    stats.count('pages', len(pages))
+    stats.count('stale_pages', len(stale))
+    last_parsed = {page: page for page in stale}
+    for page in stale:
+        found[page] = []
+    for declaration, last_page in extract_regions(path, page_regions(starts, stale), jobs, stats):
+        # regions may take in pages between stale ones
+        if declaration.page in last_parsed:
+            found[declaration.page].append(declaration)
+            last_parsed[declaration.page] = max(last_parsed[declaration.page], last_page)
+    entries = {keys[page]: [hashes[page:last_parsed[page]], [declaration[:2] for declaration in found[page]]]
+               if page in last_parsed else stored[keys[page]] for page in pages}
+    # only the pages of this input are kept
+    if entries != stored:
+        cache.put(pages_key, '.pages.json', json.dumps(entries))
+    return robot_name, [declaration for page in pages for declaration in found[page]]
+
+
+class ConversionError(Exception):
+    """pdftohtml is missing or failed to convert a PDF, or its output has no text"""
+
+
+def is_pdf(path: str) -> bool:
+    with open(path, 'rb') as file:
+        return file.read(len(PDF_MAGIC)) == PDF_MAGIC
+
+
+def pdf_page_count(path: str) -> Optional[int]:
+    try:
+        info = subprocess.run(['pdfinfo', path], stdout=subprocess.PIPE, encoding='utf-8', check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    match = PDFINFO_PAGES.search(info)
+    return int(match.group(1)) if match else None
+
+
+def page_anchor(page: int):
+    return re.compile(rf'<a name="?{page}"?>', re.IGNORECASE)
+
+
+def page_end(html: str, page: int) -> int:
+    """Finds the end of the `<hr>` line that closes a page"""
+    anchor = page_anchor(page).search(html)
+    if not anchor:
+        raise ValueError(f'page {page} not found in pdftohtml output')
+    return html.index('\n', html.index('<hr', anchor.end())) + 1
+
+
+def convert_pages(path: str, first: int, last: int, pages: int) -> str:
+    """Converts a range of pages, trimmed so that consecutive ranges join into the output of a single conversion"""
+    html = subprocess.run(PDFTOHTML + ['-f', str(first), '-l', str(last), path], stdout=subprocess.PIPE,
+                          encoding='utf-8', check=True).stdout
+    start = 0
+    if first > 1:
+        anchor = page_anchor(first).search(html)
+        if not anchor:
+            raise ValueError(f'page {first} not found in pdftohtml output')
+        start = anchor.start()
+    end = len(html) if last == pages else page_end(html, last)
+    return html[start:end]
+
+
+class PageRangeReader:
+    """Reads a PDF as pdftohtml output, converting page ranges concurrently but returning them in order"""
+
+    def __init__(self, path: str, pages: int, jobs: int):
+        pages_per_range = -(-pages // (jobs * RANGES_PER_JOB))
+        self.pool = ThreadPoolExecutor(jobs)
+        self.ranges = deque(
+            self.pool.submit(convert_pages, path, first, min(first + pages_per_range - 1, pages), pages)
+            for first in range(1, pages + 1, pages_per_range))
+        self.buffer = ''
+
+    def read(self, size: int) -> str:
+        while len(self.buffer) < size and self.ranges:
+            try:
+                self.buffer += self.ranges.popleft().result()
+            except FileNotFoundError:
+                raise ConversionError(PDFTOHTML_MISSING) from None
+            except subprocess.CalledProcessError as e:
+                raise ConversionError(f'pdftohtml exited with status {e.returncode}') from None
+            except ValueError as e:
+                raise ConversionError(f'{e}; try again with --jobs 1') from None
+        chunk = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return chunk
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+class HTMLFile:
+    """pdftohtml output in a file on disk, which `extract` searches before parsing only the pages that matter"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path)
+
+    def read(self, size: int) -> str:
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+
+@contextmanager
+def open_input(path: str, jobs: int = 1) -> Iterator[Union[TextIO, HTMLFile]]:
+    """Opens pdftohtml output: an HTML file, `-` for stdin, or a PDF that is converted by pdftohtml on the fly"""
+    if path == '-':
+        yield sys.stdin
+    elif is_pdf(path):
+        pages = pdf_page_count(path) if jobs > 1 else None
+        if pages and pages > 1:
+            reader = PageRangeReader(path, pages, jobs)
+            try:
+                yield reader
+            finally:
+                reader.close()
+            return
+        try:
+            process = subprocess.Popen(PDFTOHTML + [path], stdout=subprocess.PIPE, encoding='utf-8')
+        except FileNotFoundError:
+            raise ConversionError(PDFTOHTML_MISSING) from None
+        with process:
+            yield process.stdout
+        if process.returncode != 0:
+            raise ConversionError(f'pdftohtml exited with status {process.returncode}')
+    else:
+        file = HTMLFile(path)
+        try:
+            yield file
+        finally:
+            file.close()
+
+
+PREAMBLE = r"""#pragma once
 
 #include <endian.h>
 #include <stddef.h>
@@ -529,48 +1547,9 @@ typedef void (*FUNCPTR)(int, int, int, int, int, int, int, int, int, int);
     _a < _b ? _a : _b; })
 void _mpExitUsrRoot();
 int abs(int x);
-void mpFree(void *ptr);""")
-    robot_name = str(document.body.find(string=lambda x: len(x.strip()))).split()[0]
-    if robot_name == 'YRC1000' or robot_name == 'YRC1000micro':
-        print("""#if !defined(YRC1000) && !defined(YRC1000u)
-#error You must specify the robot type. This file only works with YRC1000 and YRC1000u controllers.
-#endif""")
-    else:
-        print(f"""#ifndef {robot_name}
-#error You must specify the robot type. This file only works with {robot_name} controllers.
-#endif""")
-    final_text = []
-    for fn in document.find_all(string=re.compile(r'\s*(Syntax:|multiple control groups\)\.).*')):
-        text = ''
-        left_over = remove_prefix((fn.text if hasattr(fn, 'text') else str(fn)).strip(), 'Syntax:')
-
-        ele = fn.next_sibling
-        while ':' not in str(ele) and '\uf06e' not in str(ele) and not has_child_of_type(ele, 'b'):
-            if ele.name == 'hr':
-                ele = nth(ele.next_siblings, 7)
-            new_text = left_over + (ele.text if hasattr(ele, 'text') else str(ele))
-            if '<' in new_text:
-                break
-            left_over = ''
-            comment_idx = new_text.find('/*')
-            if comment_idx >= 0:
-                text = parse_string(new_text[:comment_idx], text, remove_notes=False)
-                if new_text.find('*/') < 0:
-                    left_over = new_text[comment_idx:]
-                else:
-                    text = parse_string(new_text[comment_idx:], text, remove_notes=False)
-            else:
-                text = parse_string(new_text, text, remove_notes=False)
-            ele = ele.next_sibling
-            if nth(ele.next_siblings, 5).name == 'hr':
-                ele = nth(ele.next_siblings, 5)
-        if not text.strip().endswith(';'):
-            text += ';'
-        text = text.replace(SIM_LEFT_PAREN, '(').replace(SIM_COMMA, ',').replace('\u00a0', ' ')
-        text = text.replace('attribute(expansion)', 'attribute (expansion)')
-        if text not in final_text:
-            final_text.append(text)
-    final_text.append("""
+void mpFree(void *ptr);"""
+# Added by hand after the declarations extracted from the manual
+EXPOS_DATA = """
 typedef struct {
     /** Target control group which executes the increment value move */
     CTRLG_T ctrl_grp;
@@ -579,36 +1558,9 @@ typedef struct {
     /** Slave side control group for coordinated (synchronized) operation */
     CTRLG_T s_ctrl_grp;
     MP_GRP_POS_INFO grp_pos_info[MP_GRP_NUM];
-} MP_EXPOS_DATA;""")
-    final_text = '\n'.join(final_text)
-    for fn in find_syntax_headers(document):
-        text = ''
+} MP_EXPOS_DATA;"""
 
-        ele = fn.next_sibling
-        left_over = ''
-        while '\uf06e' not in str(ele):
-            new_text = left_over + (ele.text if hasattr(ele, 'text') else str(ele))
-            if STARTS_WITH_COMMENT.search(new_text):
-                break
-            left_over = ''
-            comment_idx = new_text.find('/*')
-            if comment_idx >= 0:
-                text = parse_string(new_text[:comment_idx], text)
-                closing_comment = new_text.find('*/')
-                if closing_comment < 0:
-                    left_over = new_text[comment_idx:]
-                else:
-                    text = parse_string(new_text[comment_idx:closing_comment + 2], text)
-                    text = parse_string(new_text[closing_comment + 2:], text)
-            else:
-                text = parse_string(new_text, text)
-            ele = ele.next_sibling
-        if not text.strip().endswith(';'):
-            text += ';'
-        text = text.replace(SIM_LEFT_PAREN, '(').replace(SIM_COMMA, ',').replace('\u00a0', ' ')
-        final_text += text + '\n'
-    print(fix_weirdness(final_text))
-    print(r"""
+EPILOGUE = r"""
 #if BYTE_ORDER == BIG_ENDIAN
 #ifndef FS100
 #error Somehow we think that this controller is Big Endian?
@@ -625,8 +1577,1208 @@ typedef struct {
 #define mpHtons __builtin_bswap16
 #define mpNtohl __builtin_bswap32
 #define mpNtohs __builtin_bswap16
-#endif""")
+#endif"""
+
+
+def extract(file: Union[TextIO, HTMLFile], jobs: int = 1,
+            stats: Stats = NO_STATS) -> Tuple[str, Iterator[Extracted]]:
+    """Reads pdftohtml output, returning the robot name and the raw declarations. Of an `HTMLFile`, only the pages
+    that may have declarations are parsed. Raises ConversionError if the output has no text."""
+    document = Document(file, stats, chunk_size=REGION_CHUNK_SIZE if isinstance(file, HTMLFile) else CHUNK_SIZE)
+    first_text = document.first_text()
+    if first_text is None:
+        raise ConversionError('the pdftohtml output has no text, so it may be empty or truncated')
+    robot_name = first_text.split()[0]
+    if isinstance(file, HTMLFile):
+        return robot_name, extract_mapped(file.path, jobs, stats)
+    if jobs > 1:
+        return robot_name, extract_parallel(document, jobs)
+    return robot_name, extract_declarations(document)
+
+
+def build_declarations(extracted: Iterable[Extracted], stats: Stats = NO_STATS) -> List[Declaration]:
+    """Repairs the raw declarations and turns them into deduplicated declarations in dependency order"""
+    with stats.phase('fix_weirdness'):
+        return repair_declarations(extracted, stats)
+
+
+def repair_declarations(extracted: Iterable[Extracted], stats: Stats) -> List[Declaration]:
+    pieces = []
+    starts = []
+    pages = []
+    length = 0
+    seen = set()
+    header_pieces = []
+    for from_header, text, page in extracted:
+        if from_header:
+            header_pieces.append((text + '\n', page))
+        elif text not in seen:
+            seen.add(text)
+            pieces.append(('\n' if pieces else '') + text)
+            starts.append(length)
+            pages.append(page)
+            length += len(pieces[-1])
+    for text, page in [('\n' + EXPOS_DATA, None)] + header_pieces:
+        pieces.append(text)
+        starts.append(length)
+        pages.append(page)
+        length += len(text)
+    text = fix_weirdness(''.join(pieces), starts, stats)
+    with stats.rule('parse_declarations'):
+        declarations = parse_declarations(text, starts, pages)
+    with stats.rule('dedup_declarations'):
+        declarations = dedup_declarations(declarations)
+    with stats.rule('order_declarations'):
+        return order_declarations(declarations)
+
+
+def repair_declaration(extracted: Extracted) -> List[Declaration]:
+    """Repairs one raw declaration on its own, with the same fix-ups as `build_declarations` but without deduplicating
+    or ordering it against the rest of the manual"""
+    # laid out as it would be among the others
+    text = extracted.text + '\n' if extracted.from_header else '\n' + extracted.text
+    starts = [0]
+    text = fix_weirdness(text, starts)
+    return parse_declarations(text, starts, [extracted.page])
+
+
+def iter_declarations(path: str, jobs: int = 1) -> Iterator[Declaration]:
+    """Yields the declarations of a manual (a PDF, pdftohtml output or `-` for stdin) as they are extracted, each
+    repaired by `repair_declaration`. Raises ConversionError if a PDF can't be converted."""
+    with open_input(path, jobs) as file:
+        _, extracted = extract(file, jobs)
+        for declaration in extracted:
+            yield from repair_declaration(declaration)
+
+
+def controller_macros(robot_name: str) -> List[str]:
+    """The macros that select the controller a manual is for"""
+    if robot_name == 'YRC1000' or robot_name == 'YRC1000micro':
+        return ['YRC1000', 'YRC1000u']
+    return [robot_name]
+
+
+def controller_check(macros: List[str]) -> str:
+    """Fails the build unless one of the controller macros is defined"""
+    if len(macros) == 1:
+        return f"""#ifndef {macros[0]}
+#error You must specify the robot type. This file only works with {macros[0]} controllers.
+#endif"""
+    names = ', '.join(macros[:-1]) + ' and ' + macros[-1]
+    return f"""#if {' && '.join(f'!defined({macro})' for macro in macros)}
+#error You must specify the robot type. This file only works with {names} controllers.
+#endif"""
+
+
+def render_header(macros: List[str], declarations: Iterable[Declaration]) -> str:
+    header = [PREAMBLE, controller_check(macros), render_declarations(declarations), EPILOGUE]
+    return ''.join(line + '\n' for line in header)
+
+
+def api_family(name: Optional[str]) -> Optional[str]:
+    """The API family that a function or macro belongs to by its name, if any"""
+    for family, pattern in API_FAMILIES:
+        if name and pattern.fullmatch(name):
+            return family
+    return None
+
+
+def group_declarations(declarations: List[Declaration]) -> Tuple[dict, dict]:
+    """Splits ordered declarations into API families, returning the declarations of each family in their order and
+    the other families that each one depends on.
+
+    Functions and macros belong to the family of their name, and other functions to OTHER_FAMILY. Types and constants
+    go with the one family that uses them, to COMMON_FAMILY if several do, and to the family most of the functions on
+    their manual page belong to if none does. So families only depend on each other through macros."""
+    families = [api_family(declaration.name) for declaration in declarations]
+    page_families = {}
+    for declaration, family in zip(declarations, families):
+        if isinstance(declaration, Prototype):
+            family = family or OTHER_FAMILY
+        if family:
+            counts = page_families.setdefault(declaration.page, {})
+            counts[family] = counts.get(family, 0) + 1
+    declared_by = {}
+    for i, declaration in enumerate(declarations):
+        for name in dict.fromkeys(declaration.names + [declaration.name]):
+            declared_by.setdefault(name, {}).setdefault(tuple(declaration.controllers or ()), i)
+    users = [[] for _ in declarations]
+    for j, declaration in enumerate(declarations):
+        for i in {i for name in declaration.references() for i in declared_by.get(name, {}).values()} - {j}:
+            users[i].append(j)
+    # users come after what they use, unless they are macros
+    for i in reversed(range(len(declarations))):
+        if families[i] is None and isinstance(declarations[i], Prototype):
+            families[i] = OTHER_FAMILY
+        elif families[i] is None:
+            used_by = {families[j] for j in users[i]} - {None}
+            if len(used_by) == 1:
+                families[i] = used_by.pop()
+            elif used_by:
+                families[i] = COMMON_FAMILY
+            else:
+                counts = page_families.get(declarations[i].page, {COMMON_FAMILY: 1})
+                families[i] = max(counts, key=counts.get)
+    order = [COMMON_FAMILY] + [family for family, _ in API_FAMILIES] + [OTHER_FAMILY]
+    groups = {family: [] for family in order if family == COMMON_FAMILY or family in families}
+    includes = {family: set() for family in groups}
+    for i, (declaration, family) in enumerate(zip(declarations, families)):
+        groups[family].append(declaration)
+        for j in users[i]:
+            if families[j] != family and family != COMMON_FAMILY:
+                includes[families[j]].add(family)
+    return groups, {family: [other for other in order if other in needed] for family, needed in includes.items()}
+
+
+def render_split_headers(macros: List[str], declarations: List[Declaration], directory: str) -> Tuple[str, dict]:
+    """Renders a header for each API family, to go in `directory`, and one that includes them all. Returns the
+    latter and the family headers by file name."""
+    groups, includes = group_declarations(declarations)
+    headers = {}
+    for family, members in groups.items():
+        guard = INCLUDE_GUARD.sub('_', f'{directory}_{family}_H').upper()
+        header = [f'#ifndef {guard}', f'#define {guard}']
+        if family == COMMON_FAMILY:
+            header += [remove_prefix(PREAMBLE, '#pragma once\n', PREAMBLE), controller_check(macros)]
+        else:
+            header += [f'#include "{other}.h"' for other in [COMMON_FAMILY] + includes[family]]
+        header.append(render_declarations(members))
+        if family == COMMON_FAMILY:
+            header.append(EPILOGUE)
+        header.append(f'#endif /* {guard} */')
+        headers[f'{family}.h'] = ''.join(line + '\n' for line in header)
+    guard = INCLUDE_GUARD.sub('_', f'{directory}_H').upper()
+    umbrella = [f'#ifndef {guard}', f'#define {guard}'] + [f'#include "{directory}/{name}"' for name in headers]
+    umbrella.append(f'#endif /* {guard} */')
+    return ''.join(line + '\n' for line in umbrella), headers
+
+
+def symbol_records(declarations: Iterable[Declaration]) -> List[dict]:
+    """Describes every define, typedef, struct, enum and function prototype for the symbol database, with the macros
+    of the controllers it is declared for, or None if it is declared for all of them"""
+    return [{
+        'name': declaration.name,
+        'kind': declaration.kind,
+        'page': declaration.page,
+        'docs': declaration.docs,
+        'names': list(dict.fromkeys([declaration.name] + declaration.names)),
+        'declaration': declaration.text.strip(),
+        'controllers': declaration.controllers,
+    } for declaration in declarations if declaration.kind and declaration.name]
+
+
+def merge_manuals(manuals: List[Tuple[str, List[Declaration]]],
+                  stats: Stats = NO_STATS) -> Tuple[List[str], List[Declaration]]:
+    """Returns the controller macros and the merged declarations of the robot names and repaired declarations of one
+    or more manuals"""
+    if len(manuals) == 1:
+        robot_name, declarations = manuals[0]
+        return controller_macros(robot_name), declarations
+    macros = []
+    for robot_name, _ in manuals:
+        macros += [macro for macro in controller_macros(robot_name) if macro not in macros]
+    with stats.phase('merge'):
+        return macros, merge_declarations((controller_macros(robot_name), declarations)
+                                          for robot_name, declarations in manuals)
+
+
+def render_manuals(manuals: List[Tuple[str, List[Declaration]]], stats: Stats = NO_STATS,
+                   used: Optional[Set[str]] = None, split: Optional[str] = None) -> Tuple[str, List[dict], dict]:
+    """Renders one header for the robot names and repaired declarations of one or more manuals, and describes its
+    symbols. If `used` is given, the header only declares those names and what they need; the symbols still cover
+    every manual. If `split` is given, the declarations go in a header per API family instead, returned by file name,
+    and the header includes them from the directory `split` next to it."""
+    macros, declarations = merge_manuals(manuals, stats)
+    symbols = symbol_records(declarations)
+    if used is not None:
+        with stats.phase('prune'):
+            declarations = prune_declarations(declarations, used | set(IDENTIFIER.findall(PREAMBLE + EPILOGUE)))
+    if split:
+        header, headers = render_split_headers(macros, declarations, split)
+        return header, symbols, headers
+    return render_header(macros, declarations), symbols, {}
+
+
+def generate(robot_name: str, extracted: Iterable[Extracted], stats: Stats = NO_STATS,
+             used: Optional[Set[str]] = None, split: Optional[str] = None) -> Tuple[str, List[dict], dict]:
+    """Renders the header, the headers it includes if `split`, and describes its symbols, declaring only the `used`
+    names and what they need if given"""
+    return render_manuals([(robot_name, build_declarations(extracted, stats))], stats, used, split)
+
+
+def load_manual(path: str, cache: Optional['Cache'] = None) -> Tuple[str, List[Declaration]]:
+    """Extracts and repairs the declarations of one manual, for a batch"""
+    if cache:
+        robot_name, extracted = extract_cached(path, 1, cache)
+        return robot_name, build_declarations(extracted)
+    with open_input(path) as file:
+        robot_name, extracted = extract(file)
+        return robot_name, build_declarations(extracted)
+
+
+def generate_batch(paths: List[str], jobs: int, cache: Optional['Cache'] = None, stats: Stats = NO_STATS,
+                   used: Optional[Set[str]] = None, split: Optional[str] = None) -> Tuple[str, List[dict], dict]:
+    """Renders one header for the controllers of several manuals, processed concurrently with `jobs` processes"""
+    with ProcessPoolExecutor(jobs) as pool:
+        with stats.phase('batch'):
+            manuals = list(pool.map(load_manual, paths, [cache] * len(paths)))
+    return render_manuals(manuals, stats, used, split)
+
+
+def normalize(code: str) -> str:
+    return ' '.join(code.split())
+
+
+def struct_members(code: str) -> List[str]:
+    """Splits the body of a struct or union without comments into its member declarations"""
+    body = code[code.find('{') + 1:code.rfind('}')]
+    members = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(body):
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        elif char == ';' and depth == 0:
+            members.append(body[start:i])
+            start = i + 1
+    return members
+
+
+def struct_fields(code: str) -> dict:
+    """Maps the name of each member of a struct or union without comments to its normalized declaration"""
+    fields = {}
+    for member in struct_members(code):
+        function_pointer = FUNCTION_POINTER_NAME.search(member)
+        if function_pointer:
+            fields.setdefault(function_pointer.group(1), normalize(member))
+            continue
+        for declarator in BRACKETS.sub('', member[member.rfind('}') + 1:]).split(','):
+            names = IDENTIFIER.findall(declarator)
+            if names:
+                fields.setdefault(names[-1], normalize(member))
+    return fields
+
+
+def index_declarations(declarations: Iterable[Declaration]) -> dict:
+    """Maps `(kind, name)` to the first declaration of each symbol"""
+    index = {}
+    for declaration in declarations:
+        if declaration.kind and declaration.name:
+            index.setdefault((declaration.kind, declaration.name), declaration)
+    return index
+
+
+def diff_declarations(old: Iterable[Declaration], new: Iterable[Declaration]) -> List[str]:
+    """Describes the symbols added, removed and changed between two manuals, and the changed fields of structs"""
+    old = index_declarations(old)
+    new = index_declarations(new)
+    lines = []
+    for key in sorted(old.keys() | new.keys()):
+        kind, name = key
+        before = old.get(key)
+        after = new.get(key)
+        if before is None:
+            lines.append(f'+ {kind} {name} (page {after.page})')
+            continue
+        if after is None:
+            lines.append(f'- {kind} {name} (page {before.page})')
+            continue
+        before_code = normalize(before.code())
+        after_code = normalize(after.code())
+        if before_code == after_code:
+            continue
+        pages = before.page if before.page == after.page else f'{before.page} -> {after.page}'
+        lines.append(f'~ {kind} {name} (page {pages})')
+        if isinstance(before, Struct) and isinstance(after, Struct):
+            before_fields = struct_fields(before_code)
+            after_fields = struct_fields(after_code)
+            for field in sorted(before_fields.keys() | after_fields.keys()):
+                if field not in before_fields:
+                    lines.append(f'    + field {after_fields[field]}')
+                elif field not in after_fields:
+                    lines.append(f'    - field {before_fields[field]}')
+                elif before_fields[field] != after_fields[field]:
+                    lines.append(f'    ~ field {before_fields[field]} -> {after_fields[field]}')
+        else:
+            lines.append(f'    - {before_code}')
+            lines.append(f'    + {after_code}')
+    return lines
+
+
+class Scalar(NamedTuple):
+    """A C scalar type as it is laid out on i386"""
+    size: int
+    align: int
+    # struct module format character, with standard sizes
+    code: str
+    # NumPy type string
+    dtype: str
+
+
+# The i386 System V ABI, which VxWorks uses too: long is 32 bits, and 64-bit types are only 4-byte aligned in structs
+SCALARS = {
+    'char': Scalar(1, 1, 'b', 'i1'),
+    'signed char': Scalar(1, 1, 'b', 'i1'),
+    'unsigned char': Scalar(1, 1, 'B', 'u1'),
+    '_Bool': Scalar(1, 1, '?', '?'),
+    'short': Scalar(2, 2, 'h', '<i2'),
+    'unsigned short': Scalar(2, 2, 'H', '<u2'),
+    'int': Scalar(4, 4, 'i', '<i4'),
+    'unsigned int': Scalar(4, 4, 'I', '<u4'),
+    'long': Scalar(4, 4, 'l', '<i4'),
+    'unsigned long': Scalar(4, 4, 'L', '<u4'),
+    'long long': Scalar(8, 4, 'q', '<i8'),
+    'unsigned long long': Scalar(8, 4, 'Q', '<u8'),
+    'float': Scalar(4, 4, 'f', '<f4'),
+    'double': Scalar(8, 4, 'd', '<f8'),
+    'int8_t': Scalar(1, 1, 'b', 'i1'),
+    'uint8_t': Scalar(1, 1, 'B', 'u1'),
+    'int16_t': Scalar(2, 2, 'h', '<i2'),
+    'uint16_t': Scalar(2, 2, 'H', '<u2'),
+    'int32_t': Scalar(4, 4, 'i', '<i4'),
+    'uint32_t': Scalar(4, 4, 'I', '<u4'),
+    'int64_t': Scalar(8, 4, 'q', '<i8'),
+    'uint64_t': Scalar(8, 4, 'Q', '<u8'),
+    'size_t': Scalar(4, 4, 'I', '<u4'),
+}
+SCALAR_SYNONYMS = {
+    'signed': 'int', 'signed int': 'int', 'unsigned': 'unsigned int', 'short int': 'short', 'signed short': 'short',
+    'unsigned short int': 'unsigned short', 'long int': 'long', 'signed long': 'long',
+    'unsigned long int': 'unsigned long', 'long long int': 'long long', 'signed long long': 'long long',
+    'unsigned long long int': 'unsigned long long',
+}
+# pointers and function pointers, which are packed as addresses
+POINTER = Scalar(4, 4, 'I', '<u4')
+
+
+class Field(NamedTuple):
+    name: str
+    offset: int
+    type: Union[Scalar, 'Layout']
+    # array dimensions, outermost first
+    shape: Tuple[int, ...]
+
+
+class Layout(NamedTuple):
+    """The i386 layout of a struct or union, named like its symbol if it has one"""
+    name: Optional[str]
+    size: int
+    align: int
+    union: bool
+    fields: List[Field]
+
+
+class LayoutError(Exception):
+    """A struct whose layout can't be worked out from the declarations, such as one with bit-fields"""
+
+
+def c_divide(a: int, b: int) -> int:
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+BINARY_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.FloorDiv: c_divide,
+                    ast.Mod: lambda a, b: a - b * c_divide(a, b), ast.LShift: operator.lshift,
+                    ast.RShift: operator.rshift, ast.BitOr: operator.or_, ast.BitAnd: operator.and_,
+                    ast.BitXor: operator.xor}
+UNARY_OPERATORS = {ast.UAdd: operator.pos, ast.USub: operator.neg, ast.Invert: operator.invert}
+
+
+def evaluate_constant(expression: str, constant: Callable[[str], int]) -> int:
+    """Evaluates a C integer constant expression, looking up the macros and enum constants in it with `constant`"""
+    source = OCTAL_LITERAL.sub(r'0o\1', INTEGER_SUFFIX.sub(r'\1', expression.strip())).replace('/', '//')
+
+    def value(node: ast.AST) -> int:
+        if isinstance(node, ast.Constant) and type(node.value) is int:
+            return node.value
+        if isinstance(node, ast.Name):
+            return constant(node.id)
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            return BINARY_OPERATORS[type(node.op)](value(node.left), value(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            return UNARY_OPERATORS[type(node.op)](value(node.operand))
+        raise LayoutError(f'{expression.strip()} is not an integer constant')
+
+    try:
+        return value(ast.parse(source, mode='eval').body)
+    except (SyntaxError, ZeroDivisionError):
+        raise LayoutError(f'{expression.strip()} is not an integer constant') from None
+
+
+def split_declarators(text: str) -> List[str]:
+    """Splits a declaration without its type at the commas between declarators"""
+    declarators = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(text):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            declarators.append(text[start:i])
+            start = i + 1
+    declarators.append(text[start:])
+    return declarators
+
+
+class LayoutResolver:
+    """Works out the i386 layouts of structs and unions from the typedefs, tags, macros and enum constants among
+    symbol records. Earlier records win over later ones with the same name, like in a merged header."""
+
+    def __init__(self, records: Iterable[dict]):
+        # the expression of each object-like macro and enum constant
+        self.macros = {}
+        self.values = {}
+        self.evaluating = set()
+        # the code of the declaration of each typedef name and struct, union and enum tag
+        self.types = {}
+        self.resolved = {}
+        self.layouts = {}
+        for record in records:
+            code = COMMENT.sub(' ', record['declaration'])
+            if record['kind'] == 'define':
+                define = DEFINE_VALUE.match(code)
+                if define:
+                    self.macros.setdefault(define.group(1), define.group(2))
+                continue
+            body = TYPE_BODY.search(code)
+            if body and body.group(1) == 'enum':
+                self.add_enum_constants(code)
+            if body and body.group(2):
+                self.types.setdefault(f'{body.group(1)} {body.group(2)}', code)
+            if TYPEDEF.match(code):
+                for name in typedef_names(code):
+                    self.types.setdefault(name, code)
+
+    def add_enum_constants(self, code: str):
+        previous = None
+        for enumerator in ENUM_BODY.search(code).group(1).split(','):
+            name, _, value = enumerator.partition('=')
+            name = name.strip()
+            if name:
+                self.macros.setdefault(name, value if value.strip() else f'{previous} + 1' if previous else '0')
+                previous = name
+
+    def constant(self, name: str) -> int:
+        if name not in self.values:
+            if name not in self.macros or name in self.evaluating:
+                raise LayoutError(f'{name} is not a known constant')
+            self.evaluating.add(name)
+            try:
+                self.values[name] = evaluate_constant(self.macros[name], self.constant)
+            finally:
+                self.evaluating.discard(name)
+        return self.values[name]
+
+    def resolve(self, spec: str) -> Tuple[Union[Scalar, Layout], Tuple[int, ...]]:
+        """The type and array dimensions named by a type specifier"""
+        spec = ' '.join(TYPE_QUALIFIER.sub(' ', spec).split())
+        spec = SCALAR_SYNONYMS.get(spec, spec)
+        if spec in SCALARS:
+            return SCALARS[spec], ()
+        if spec.startswith('enum '):
+            return SCALARS['int'], ()
+        if spec not in self.resolved:
+            if spec in self.types:
+                self.resolved[spec] = self.type_definition(spec, self.types[spec])
+            elif spec in self.macros:
+                self.resolved[spec] = self.resolve(self.macros[spec])
+            else:
+                raise LayoutError(f'{spec or "a member"} has an unknown type')
+        return self.resolved[spec]
+
+    def type_definition(self, name: str, code: str) -> Tuple[Union[Scalar, Layout], Tuple[int, ...]]:
+        """The type and array dimensions that a declaration gives the typedef name or tag `name`"""
+        if name.startswith(('struct ', 'union ')):
+            return self.layout(code), ()
+        body = TYPE_BODY.search(code)
+        function_pointer = FUNCTION_POINTER_NAME.search(code[code.rfind('}') + 1:])
+        if function_pointer:
+            return POINTER, ()
+        if body:
+            declarators = code[code.rfind('}') + 1:]
+            base = lambda: (SCALARS['int'] if body.group(1) == 'enum' else self.layout(code), ())
+        else:
+            spec, declarators = self.split_type(TYPEDEF.sub('', code, 1))
+            base = lambda: self.resolve(spec)
+        for declarator, pointer, shape in self.declarators(declarators):
+            if declarator == name:
+                if pointer:
+                    return POINTER, shape
+                member_type, base_shape = base()
+                return member_type, shape + base_shape
+        raise LayoutError(f'{name} is not declared by its typedef')
+
+    def layout(self, code: str) -> Layout:
+        """The layout of a struct or union definition without comments"""
+        if code in self.layouts:
+            return self.layouts[code]
+        body = TYPE_BODY.search(code)
+        union = body.group(1) == 'union'
+        typedefs = typedef_names(code) if TYPEDEF.match(code) else []
+        name = typedefs[0] if typedefs else body.group(2) or None
+        fields = []
+        offset = 0
+        size = 0
+        align = 1
+        for member in struct_members(code):
+            for field, member_type, shape in self.members(member):
+                if not union:
+                    offset = -(-offset // member_type.align) * member_type.align
+                fields.append(Field(field, offset, member_type, shape))
+                align = max(align, member_type.align)
+                if union:
+                    size = max(size, member_type.size * math.prod(shape))
+                else:
+                    offset += member_type.size * math.prod(shape)
+                    size = offset
+        if not fields:
+            raise LayoutError(f'{name or "a nested struct"} has no members')
+        layout = Layout(name, -(-size // align) * align, align, union, fields)
+        self.layouts[code] = layout
+        return layout
+
+    def members(self, member: str) -> Iterator[Tuple[str, Union[Scalar, Layout], Tuple[int, ...]]]:
+        """The name, member_type and array dimensions of each member declared by a member declaration"""
+        if not member.strip():
+            return
+        function_pointer = FUNCTION_POINTER_NAME.search(member[member.rfind('}') + 1:])
+        if function_pointer:
+            yield function_pointer.group(1), POINTER, ()
+            return
+        if '{' in member:
+            declarators = member[member.rfind('}') + 1:]
+            if not declarators.strip():
+                raise LayoutError('anonymous members are not supported')
+            if ':' in declarators:
+                raise LayoutError('bit-fields are not supported')
+            nested = TYPE_BODY.search(member).group(1)
+            base = lambda: (SCALARS['int'] if nested == 'enum' else self.layout(member), ())
+        elif ':' in member:
+            raise LayoutError('bit-fields are not supported')
+        else:
+            spec, declarators = self.split_type(member)
+            base = lambda: self.resolve(spec)
+        for name, pointer, shape in self.declarators(declarators):
+            if pointer:
+                yield name, POINTER, shape
+            else:
+                member_type, base_shape = base()
+                yield name, member_type, shape + base_shape
+
+    @staticmethod
+    def split_type(declaration: str) -> Tuple[str, str]:
+        """Splits a declaration without braces into its member_type specifier and declarators"""
+        first = split_declarators(declaration)[0]
+        declarator = MEMBER_DECLARATOR.search(first.rstrip(' \n;'))
+        if not declarator:
+            raise LayoutError(f'{normalize(declaration)} has no declarator')
+        return first[:declarator.start()], declaration[declarator.start():]
+
+    def declarators(self, text: str) -> Iterator[Tuple[str, bool, Tuple[int, ...]]]:
+        """The name, whether it is a pointer, and the array dimensions of each declarator"""
+        for declarator in split_declarators(text.strip().rstrip(';')):
+            match = MEMBER_DECLARATOR.fullmatch(declarator.strip())
+            if not match:
+                raise LayoutError(f'{normalize(declarator)} is not a supported declarator')
+            stars, name, dimensions = match.groups()
+            shape = tuple(self.dimension(dimension) for dimension in ARRAY_DIMENSION.findall(dimensions))
+            yield name, bool(stars), shape
+
+    def dimension(self, expression: str) -> int:
+        if not expression.strip():
+            raise LayoutError('arrays without a size are not supported')
+        return evaluate_constant(expression, self.constant)
+
+
+def struct_items(layout: Layout, prefix: str = '', base: int = 0) -> Iterator[Tuple[int, str, str]]:
+    """The offset, struct module format and flattened name of each value of a layout, with arrays and nested structs
+    flattened. Char arrays are one bytes value, and so are unions."""
+    for field in layout.fields:
+        member_type = field.type
+        shape = field.shape
+        if isinstance(member_type, Scalar) and member_type.size == 1 and shape:
+            *shape, length = shape
+            item, size = f'{length}s', length
+        elif isinstance(member_type, Layout) and member_type.union:
+            item, size = f'{member_type.size}s', member_type.size
+        else:
+            item, size = member_type.code if isinstance(member_type, Scalar) else None, member_type.size
+        for index, element in enumerate(itertools.product(*map(range, shape))):
+            name = prefix + field.name + ''.join(f'[{i}]' for i in element)
+            offset = base + field.offset + index * size
+            if item is None:
+                yield from struct_items(member_type, name + '.', offset)
+            else:
+                yield offset, item, name
+
+
+def struct_format(layout: Layout) -> Tuple[str, List[str]]:
+    """The little-endian struct module format of a layout, with padding, and the names of the values it packs"""
+    items = [(0, f'{layout.size}s', layout.name)] if layout.union else struct_items(layout)
+    # (count, code) pairs, with runs of the same code merged
+    codes = []
+    names = []
+    position = 0
+    for offset, item, name in items:
+        for count, code in ((offset - position, 'x'), (int(item[:-1] or 1), item[-1])):
+            if count and codes and codes[-1][1] == code != 's':
+                codes[-1] = (codes[-1][0] + count, code)
+            elif count:
+                codes.append((count, code))
+        names.append(name)
+        position = offset + struct.calcsize('<' + item)
+    if layout.size > position:
+        codes.append((layout.size - position, 'x'))
+    packing = '<' + ''.join(f'{count}{code}' if count > 1 or code == 's' else code for count, code in codes)
+    assert struct.calcsize(packing) == layout.size, (layout.name, packing)
+    return packing, names
+
+
+def dtype_source(layout: Layout, defined: Set[str]) -> str:
+    """Python source creating the NumPy dtype of a layout, referring to the `defined` entries of DTYPES"""
+    formats = []
+    for field in layout.fields:
+        member_type = field.type
+        shape = field.shape
+        if isinstance(member_type, Layout):
+            if member_type.name in defined:
+                item = f'DTYPES[{member_type.name!r}]'
+            else:
+                item = dtype_source(member_type, defined)
+        elif member_type.size == 1 and shape:
+            *shape, length = shape
+            item = repr(f'S{length}')
+        else:
+            item = repr(member_type.dtype)
+        formats.append(f'({item}, {tuple(shape)!r})' if shape else item)
+    return (f"numpy.dtype({{'names': {[field.name for field in layout.fields]!r}, 'formats': [{', '.join(formats)}], "
+            f"'offsets': {[field.offset for field in layout.fields]!r}, 'itemsize': {layout.size}}})")
+
+
+LAYOUTS_DOCSTRING = '''"""Layouts of the MotoPlus structs and unions on the controller, generated by ExtractPlus.
+
+STRUCTS has a little-endian struct.Struct for each of them, and FIELDS the names of the values it packs: arrays and
+nested structs are flattened into names like "grp_pos_info[0].pos[1]", and char arrays and unions are single bytes
+values. DTYPES has a NumPy structured dtype for each of them if NumPy is installed, to read arrays of structs at once.
+"""'''
+LAYOUTS_UNPACK = '''def unpack(name, buffer, offset=0):
+    """Unpacks the struct `name` from `buffer` at `offset` into a dict of its flattened fields"""
+    return dict(zip(FIELDS[name], STRUCTS[name].unpack_from(buffer, offset)))'''
+
+
+def render_layouts(symbols: List[dict]) -> str:
+    """Renders a Python module with the struct.Struct and NumPy dtype layouts of the structs and unions among the
+    symbols of a header and its preamble"""
+    records = symbol_records(parse_declarations(PREAMBLE, [0], [None])) + symbols
+    resolver = LayoutResolver(records)
+    layouts = {}
+    skipped = []
+    for record in records:
+        if record['kind'] != 'struct' or record['name'] in layouts:
+            continue
+        try:
+            layouts[record['name']] = resolver.layout(COMMENT.sub(' ', record['declaration']))
+        except LayoutError as e:
+            skipped.append(f'# {record["name"]}: {e}')
+    module = [LAYOUTS_DOCSTRING, '']
+    if skipped:
+        module += ['# Structs without a layout:'] + skipped + ['']
+    module += ['import struct', '', 'STRUCTS = {}', 'FIELDS = {}']
+    for name, layout in layouts.items():
+        packing, names = struct_format(layout)
+        module.append(f'STRUCTS[{name!r}] = struct.Struct({packing!r})')
+        module.append(f'FIELDS[{name!r}] = {tuple(names)!r}')
+    module += ['', '', LAYOUTS_UNPACK, '', '', 'try:', '    import numpy', 'except ImportError:', '    numpy = None',
+               '', 'DTYPES = {}', 'if numpy is not None:']
+    defined = set()
+    for name, layout in layouts.items():
+        module.append(f'    DTYPES[{name!r}] = {dtype_source(layout, defined)}')
+        defined.add(name)
+    return ''.join(line + '\n' for line in module)
+
+
+# Everything that decides which raw declarations are extracted from the HTML
+EXTRACTION_CODE = (SIM_LEFT_PAREN, SIM_COMMA, STARTS_WITH_COMMENT, REMOVE_NOTES, SYNTAX_ANCHORS, VOID_TAGS, ASCII_SPACES,
+                   ANCHOR_BYTES, PAGE_BREAK_BYTES, remove_prefix, BodyParser, Document, Shard, is_syntax_header,
+                   parse_string, extract_syntax, extract_syntax_header, extract_at, extract_declarations, page_starts,
+                   anchor_pages, page_regions, extract_region, extract_paged, extract)
+# Everything that turns raw declarations into the header, including every regex constant, as the rules and the
+# declaration parser use most of them
+FIXUP_CODE = (PREAMBLE, EXPOS_DATA, EPILOGUE, substitute, fix_defines, preprocessor_line_end, split_declarations,
+              typedef_names, declared_names, Declaration, Directive, Define, Typedef, Struct, Enum, Prototype,
+              parse_declaration, parse_declarations, dedup_declarations, order_declarations, render_declarations,
+              FIXUPS, apply_fixup, fix_weirdness, build_declarations, repair_declarations, render_header,
+              symbol_records, prune_declarations, controller_macros, render_manuals, generate, controller_check,
+              API_FAMILIES, COMMON_FAMILY, OTHER_FAMILY, api_family, group_declarations, render_split_headers,
+              *(value for _, value in sorted(globals().items()) if isinstance(value, re.Pattern)))
+
+
+def code_hash(code) -> str:
+    digest = hashlib.sha256()
+    lines = linecache.getlines(__file__)
+    # inspect.getsource parses the whole file again for every class, so they are all found in one parse
+    classes = {node.name: ''.join(lines[node.lineno - 1:node.end_lineno])
+               for node in ast.parse(''.join(lines)).body if isinstance(node, ast.ClassDef)}
+    for item in code:
+        if inspect.isclass(item):
+            item = classes[item.__name__]
+        elif callable(item):
+            item = inspect.getsource(item)
+        elif isinstance(item, re.Pattern):
+            item = (item.pattern, item.flags)
+        elif isinstance(item, (set, frozenset)):
+            # set order changes with the string hash seed of each run
+            item = sorted(item)
+        digest.update(repr(item).encode())
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def extraction_hash() -> str:
+    """The hash of EXTRACTION_CODE, computed once per process"""
+    return code_hash(EXTRACTION_CODE)
+
+
+@functools.lru_cache(maxsize=None)
+def fixup_hash() -> str:
+    """The hash of FIXUP_CODE, computed once per process"""
+    return code_hash(FIXUP_CODE)
+
+
+def atomic_write(path: str, data: bytes):
+    """Replaces `path` with `data` so that readers never see a partially written file"""
+    try:
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.')
+    except OSError as e:
+        raise ConversionError(f'cannot write {path}: {e.strerror}') from None
+    try:
+        with open(fd, 'wb') as file:
+            file.write(data)
+        if os.path.exists(path):
+            shutil.copymode(path, temp)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp, 0o666 & ~umask)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def write_if_changed(path: str, contents: Union[str, bytes]) -> bool:
+    """Writes `contents` to `path` unless it already holds exactly that, so its modification time only moves on
+    change"""
+    data = contents.encode('utf-8') if isinstance(contents, str) else contents
+    try:
+        if file_hash(path) == hashlib.sha256(data).hexdigest():
+            return False
+    except FileNotFoundError:
+        pass
+    atomic_write(path, data)
+    return True
+
+
+def split_directory(args: argparse.Namespace) -> Optional[str]:
+    """The directory next to the -o header that --split puts the family headers in"""
+    return os.path.splitext(os.path.basename(args.output))[0] if args.split else None
+
+
+def generated_paths(args: argparse.Namespace) -> List[str]:
+    """The headers written by this run, which --only-used doesn't scan"""
+    if not args.output:
+        return []
+    return [args.output] + ([os.path.splitext(args.output)[0]] if args.split else [])
+
+
+def write_headers(path: str, header: str, headers: dict) -> bool:
+    """Writes the header to `path` and the headers it includes to the directory named after it, returning whether
+    any of them changed"""
+    written = False
+    if headers:
+        directory = os.path.splitext(path)[0]
+        os.makedirs(directory, exist_ok=True)
+        for name, contents in headers.items():
+            written |= write_if_changed(os.path.join(directory, name), contents)
+    return write_if_changed(path, header) or written
+
+
+def symbols_database(symbols: List[dict]) -> bytes:
+    """Builds an SQLite symbol database, indexed by the name of each symbol and by every name it declares"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'symbols.db')
+        connection = sqlite3.connect(path)
+        try:
+            with connection:
+                connection.executescript(SYMBOLS_SCHEMA)
+                for id, symbol in enumerate(symbols, 1):
+                    controllers = symbol['controllers']
+                    connection.execute('INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                       (id, symbol['name'], symbol['kind'], symbol['page'], json.dumps(symbol['docs']),
+                                        symbol['declaration'], json.dumps(controllers) if controllers else None))
+                    connection.executemany('INSERT INTO names VALUES (?, ?)',
+                                           [(name, id) for name in symbol['names']])
+        finally:
+            connection.close()
+        with open(path, 'rb') as file:
+            return file.read()
+
+
+def write_symbols(path: str, symbols: List[dict]) -> bool:
+    """Writes the symbol database as SQLite if `path` has an SQLite suffix, or as JSON lines otherwise"""
+    if path.endswith(SQLITE_SUFFIXES):
+        return write_if_changed(path, symbols_database(symbols))
+    return write_if_changed(path, ''.join(json.dumps(symbol) + '\n' for symbol in symbols))
+
+
+def source_files(directory: str, exclude: Iterable[str] = ()) -> List[str]:
+    """Lists the C sources and headers under `directory`, other than the generated header and the files and directories
+    in `exclude`"""
+    exclude = {os.path.realpath(path) for path in exclude}
+    paths = []
+    for root, directories, files in os.walk(directory):
+        directories[:] = [name for name in directories if os.path.realpath(os.path.join(root, name)) not in exclude]
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(SOURCE_SUFFIXES) and name != HEADER_NAME and os.path.realpath(path) not in exclude:
+                paths.append(path)
+    return paths
+
+
+def used_names(directory: str, exclude: Iterable[str] = ()) -> Set[str]:
+    """Collects the identifiers in the C sources and headers under `directory`, skipping the generated header and the
+    files in `exclude`"""
+    names = set()
+    for path in source_files(directory, exclude):
+        with open(path, encoding='utf-8', errors='replace') as file:
+            names.update(IDENTIFIER.findall(COMMENT.sub(' ', file.read())))
+    return names
+
+
+def cache_key(*parts: str) -> str:
+    return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Cache:
+    """A content-addressed store of converted HTML, raw declarations and headers.
+
+    Hits refresh an entry's modification time, and the least recently used entries are evicted beyond `max_size`."""
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str, suffix: str) -> Optional[str]:
+        path = os.path.join(self.directory, key + suffix)
+        try:
+            with open(path, encoding='utf-8') as file:
+                text = file.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return text
+
+    def put(self, key: str, suffix: str, text: str):
+        atomic_write(os.path.join(self.directory, key + suffix), text.encode('utf-8'))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # evicted by another process sharing the cache
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def hash_input(path: str) -> Tuple[str, Optional[str]]:
+    """Hashes the input, returning the HTML too if it had to be read whole to do so"""
+    if path == '-':
+        html = sys.stdin.read()
+        return hashlib.sha256(html.encode()).hexdigest(), html
+    return file_hash(path), None
+
+
+def extract_cached(path: str, jobs: int, cache: Cache, stats: Stats = NO_STATS,
+                   hashed: Optional[Tuple[str, Optional[str]]] = None) -> Tuple[str, List[Extracted]]:
+    """Extracts the raw declarations, reusing whatever the cache holds for this input and extraction code.
+    `hashed` is what `hash_input` returned, if it was already called."""
+    input_hash, html = hashed or hash_input(path)
+    declarations_key = cache_key(input_hash, extraction_hash())
+
+    extracted = cache.get(declarations_key, '.json')
+    if extracted is not None:
+        robot_name, declarations = json.loads(extracted)
+        return robot_name, [Extracted(*declaration) for declaration in declarations]
+    if html is None and is_pdf(path):
+        html = cache.get(input_hash, '.html')
+        if html is None:
+            with open_input(path, jobs) as file:
+                html = ''.join(iter(lambda: file.read(CHUNK_SIZE), ''))
+            cache.put(input_hash, '.html', html)
+    if html is None:
+        robot_name, declarations = extract_paged(path, cache, jobs, stats)
+    else:
+        # pages are hashed and parsed from a file, like an HTML input
+        with tempfile.NamedTemporaryFile('w', suffix='.html', prefix='.', dir=cache.directory) as file:
+            file.write(html)
+            file.flush()
+            robot_name, declarations = extract_paged(file.name, cache, jobs, stats)
+    cache.put(declarations_key, '.json', json.dumps([robot_name, declarations]))
+    return robot_name, declarations
+
+
+def generate_cached(path: str, jobs: int, cache: Cache, stats: Stats = NO_STATS, used: Optional[Set[str]] = None,
+                    split: Optional[str] = None) -> Tuple[str, List[dict], dict]:
+    """Renders the header and describes its symbols, reusing whatever the cache holds for this input, extraction
+    code and fix-up rules"""
+    hashed = hash_input(path)
+    declarations_key = cache_key(hashed[0], extraction_hash())
+    # split directories end in a slash, so they can't be mistaken for used names
+    header_key = cache_key(declarations_key, fixup_hash(), *([f'{split}/'] if split else []),
+                           *([] if used is None else sorted(used)))
+
+    header = cache.get(header_key, '.h')
+    symbols = cache.get(header_key, '.symbols.json')
+    headers = cache.get(header_key, '.headers.json') if split else '{}'
+    if header is not None and symbols is not None and headers is not None:
+        return header, json.loads(symbols), json.loads(headers)
+    robot_name, declarations = extract_cached(path, jobs, cache, stats, hashed)
+    header, symbols, headers = generate(robot_name, declarations, stats, used, split)
+    cache.put(header_key, '.h', header)
+    cache.put(header_key, '.symbols.json', json.dumps(symbols))
+    if split:
+        cache.put(header_key, '.headers.json', json.dumps(headers))
+    return header, symbols, headers
+
+
+def load_rules():
+    """Imports a fresh copy of this file, so that edits to the fix-up rules and the preamble take effect"""
+    path = os.path.abspath(__file__)
+    # inspect.getsource, which code_hash uses, reads through linecache
+    linecache.checkcache(path)
+    spec = importlib.util.spec_from_file_location('extractplus_rules', path)
+    module = importlib.util.module_from_spec(spec)
+    # inspect finds the source of classes through their module
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Watcher:
+    """Regenerates the header whenever the manuals, this file or the --only-used sources change.
+
+    The raw declarations of every manual stay in memory, and so do the repaired ones. A changed manual is extracted
+    again. Changed rules in this file repair every manual again, and only extract them again if the extraction code
+    changed too. Changed sources are only scanned, pruned and rendered again."""
+
+    def __init__(self, args: argparse.Namespace, cache: Optional[Cache]):
+        self.args = args
+        self.cache = cache
+        self.script = os.path.abspath(__file__)
+        self.rules = sys.modules[__name__]
+        self.extraction_hash = extraction_hash()
+        self.extracted = {}
+        self.repaired = {}
+        self.used = None
+        self.times = {}
+
+    def snapshot(self) -> dict:
+        paths = [self.script] + self.args.input
+        if self.args.only_used:
+            paths += source_files(self.args.only_used, generated_paths(self.args))
+        times = {}
+        for path in paths:
+            try:
+                times[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                times[path] = None
+        return times
+
+    def extract(self, path: str) -> Tuple[str, List[Extracted]]:
+        rules = self.rules
+        # workers can't unpickle the functions of a reloaded copy of this file
+        jobs = (self.args.jobs or 1) if rules is sys.modules[__name__] else 1
+        if self.cache:
+            return rules.extract_cached(path, jobs, self.cache)
+        with rules.open_input(path, jobs) as file:
+            robot_name, extracted = rules.extract(file, jobs)
+            return robot_name, list(extracted)
+
+    def update(self, changed: Set[str]):
+        start = time.perf_counter()
+        stale = [path for path in self.args.input if path in changed]
+        if self.script in changed and self.extracted:
+            self.rules = load_rules()
+            self.repaired = {}
+            extraction_hash = self.rules.extraction_hash()
+            if extraction_hash != self.extraction_hash:
+                self.extraction_hash = extraction_hash
+                stale = self.args.input
+        for path in stale:
+            self.extracted[path] = self.extract(path)
+            self.repaired.pop(path, None)
+        repairs = 0
+        for path in self.args.input:
+            if path not in self.repaired:
+                robot_name, extracted = self.extracted[path]
+                self.repaired[path] = robot_name, self.rules.build_declarations(extracted)
+                repairs += 1
+        if self.args.only_used and (self.used is None or changed - {self.script} - set(self.args.input)):
+            self.used = used_names(self.args.only_used, generated_paths(self.args))
+        header, symbols, headers = self.rules.render_manuals([self.repaired[path] for path in self.args.input],
+                                                             used=self.used, split=split_directory(self.args))
+        written = write_headers(self.args.output, header, headers)
+        if self.args.symbols:
+            write_symbols(self.args.symbols, symbols)
+        if self.args.python:
+            write_if_changed(self.args.python, self.rules.render_layouts(symbols))
+        print(f'{self.args.output}: {"rewritten" if written else "unchanged"} after extracting {len(stale)} and '
+              f'repairing {repairs} manuals ({time.perf_counter() - start:.2f}s)', file=sys.stderr)
+
+    def run(self):
+        while True:
+            times = self.snapshot()
+            changed = {path for path in times.keys() | self.times.keys() if times.get(path) != self.times.get(path)}
+            self.times = times
+            if changed:
+                try:
+                    self.update(changed)
+                except ConversionError as e:
+                    print(e, file=sys.stderr)
+                except Exception:
+                    # keep watching, so that the next edit can fix the rules or the manual
+                    traceback.print_exc()
+            time.sleep(WATCH_INTERVAL)
+
+
+def diff_main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='main.py diff',
+                                     description='Lists the functions, structs, struct fields, typedefs, enums and '
+                                                 'defines that differ between two revisions of a manual')
+    parser.add_argument('old', help='the older manual, as a PDF or pdftohtml -i -noframes output')
+    parser.add_argument('new', help='the newer manual')
+    parser.add_argument('--cache', metavar='DIR', help='reuse conversion and extraction results stored in DIR')
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=256,
+                        help='evict the least recently used cache entries beyond this size (default: 256)')
+    args = parser.parse_args(argv)
+
+    cache = Cache(args.cache, args.cache_size << 20) if args.cache else None
+    with ProcessPoolExecutor(2) as pool:
+        (_, old), (_, new) = pool.map(load_manual, [args.old, args.new], [cache, cache])
+    lines = diff_declarations(old, new)
+    for line in lines:
+        print(line)
+    return 1 if lines else 0
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['diff']:
+        sys.exit(diff_main(argv[1:]))
+    parser = argparse.ArgumentParser(description='Extracts MotoPlus header files from the API documentation',
+                                     epilog='Run "%(prog)s diff OLD NEW" to compare two revisions of a manual.')
+    parser.add_argument('input', nargs='+',
+                        help='pdftohtml -i -noframes output, the PDF itself, or - to read HTML from stdin. Given the '
+                             'manuals of several controllers, writes one header for all of them.')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='convert and extract pages, or whole manuals, in parallel with this many processes '
+                             '(default: 1, or one per manual and core for several manuals)')
+    parser.add_argument('--cache', metavar='DIR', help='reuse conversion and extraction results stored in DIR')
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=256,
+                        help='evict the least recently used cache entries beyond this size (default: 256)')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='write the header to FILE, leaving it untouched if it would not change')
+    parser.add_argument('--only-used', metavar='SRC_DIR',
+                        help='only declare what the C sources under SRC_DIR use, and what that depends on')
+    parser.add_argument('--symbols', metavar='FILE',
+                        help='also write a database of the extracted symbols to FILE: SQLite if it ends in .db, '
+                             '.sqlite or .sqlite3, JSON lines otherwise')
+    parser.add_argument('--split', action='store_true',
+                        help='put the declarations in a header per API family (motion.h, socket.h, ...) in a '
+                             'directory named after the -o header, which then includes them all')
+    parser.add_argument('--python', metavar='FILE',
+                        help='also write a Python module with the i386 layouts of the structs, as struct.Struct '
+                             'objects and NumPy dtypes, to FILE')
+    parser.add_argument('--stats', choices=('text', 'json'),
+                        help='report the time and memory of each phase and fix-up rule on stderr in this format')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running, and rewrite the -o header whenever the manuals, main.py or the --only-used '
+                             'sources change, without extracting the manuals again unless they or the extraction '
+                             'code changed')
+    args = parser.parse_args(argv)
+    if len(args.input) > 1 and '-' in args.input:
+        parser.error('stdin can only be read as the only input')
+    if args.watch and (not args.output or '-' in args.input or args.stats):
+        parser.error('--watch needs -o and input files, and cannot report --stats')
+    if args.split and not args.output:
+        parser.error('--split needs -o')
+
+    cache = Cache(args.cache, args.cache_size << 20) if args.cache else None
+    if args.watch:
+        try:
+            Watcher(args, cache).run()
+        except KeyboardInterrupt:
+            pass
+        return
+    stats = Stats(enabled=args.stats is not None)
+    used = None
+    if args.only_used:
+        with stats.phase('scan_sources'):
+            used = used_names(args.only_used, generated_paths(args))
+    split = split_directory(args)
+    if len(args.input) > 1:
+        jobs = args.jobs or min(len(args.input), os.cpu_count() or 1)
+        header, symbols, headers = generate_batch(args.input, jobs, cache, stats, used, split)
+    elif cache:
+        header, symbols, headers = generate_cached(args.input[0], args.jobs or 1, cache, stats, used, split)
+    else:
+        with open_input(args.input[0], args.jobs or 1) as file:
+            header, symbols, headers = generate(*extract(file, args.jobs or 1, stats), stats, used, split)
+    with stats.phase('output'):
+        if args.output:
+            write_headers(args.output, header, headers)
+        else:
+            sys.stdout.write(header)
+        if args.symbols:
+            write_symbols(args.symbols, symbols)
+        if args.python:
+            write_if_changed(args.python, render_layouts(symbols))
+    if args.stats == 'json':
+        print(stats.json(), file=sys.stderr)
+    elif args.stats:
+        print(stats.text(), file=sys.stderr)
 
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    except (ConversionError, OSError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)